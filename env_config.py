@@ -0,0 +1,11 @@
+from functools import cache
+
+from dotenv import load_dotenv
+
+@cache
+def load_env() -> bool:
+    """
+    Load .env into os.environ once per process. Every entry module calls this at
+    import, so the file is found and parsed on the first call only
+    """
+    return load_dotenv()
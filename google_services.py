@@ -1,14 +1,31 @@
 import os
 import logging
-from typing import Optional, Tuple, Dict, Any
+from typing import Callable, Optional, Tuple, Dict, Any
 import io
 import json
+import hashlib
+import tempfile
+import threading
 from datetime import datetime
+from cachetools import LRUCache
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
 logger = logging.getLogger(__name__)
 
+# Keepalive pings stop idle load balancers from dropping the channel, so bursts of
+# STT/TTS calls reuse one multiplexed connection instead of re-handshaking TLS
+GRPC_CHANNEL_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30000),
+    ("grpc.keepalive_timeout_ms", 10000),
+    ("grpc.keepalive_permit_without_calls", 1),
+    ("grpc.http2.max_pings_without_data", 0),
+    # A prebuilt channel skips the gapic defaults, which lift gRPC's 4 MB message
+    # caps; long LINEAR16 syntheses exceed that
+    ("grpc.max_send_message_length", -1),
+    ("grpc.max_receive_message_length", -1),
+]
+
 class GoogleCloudServicesError(Exception):
     """Custom exception for Google Cloud Services errors"""
     pass
@@ -35,9 +52,27 @@ class GoogleCloudServices:
         self.is_configured = False
         self.config_errors = []
         
+        # Synthesized audio cache: in-memory LRU backed by a bounded disk tier
+        self.tts_cache = LRUCache(maxsize=int(os.getenv('TTS_CACHE_SIZE', '1024')))
+        self.tts_cache_lock = threading.Lock()
+        # Private per-user cache dir rather than the shared system temp dir
+        cache_home = os.getenv('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+        self.tts_cache_dir = os.getenv('TTS_CACHE_DIR', os.path.join(cache_home, 'voice-assistant', 'tts'))
+        self.tts_disk_cache_max_files = int(os.getenv('TTS_DISK_CACHE_MAX_FILES', '10000'))
+        # Sweep the disk tier every ~10% of its capacity instead of on every write
+        self.tts_disk_sweep_interval = max(1, self.tts_disk_cache_max_files // 10)
+        self.tts_disk_writes = 0
+        
         # Initialize services
         self._initialize_services()
     
+    @staticmethod
+    def _grpc_transport(client_class):
+        """Build a gRPC transport whose HTTP/2 channel stays warm between requests"""
+        transport_class = client_class.get_transport_class("grpc")
+        channel = transport_class.create_channel(options=GRPC_CHANNEL_OPTIONS)
+        return transport_class(channel=channel)
+    
     def _initialize_services(self):
         """Initialize Google Cloud services with proper error handling"""
         try:
@@ -46,11 +81,11 @@ class GoogleCloudServices:
             
             # Initialize Speech-to-Text client
             from google.cloud import speech
-            self.speech_client = speech.SpeechClient()
+            self.speech_client = speech.SpeechClient(transport=self._grpc_transport(speech.SpeechClient))
             
             # Initialize Text-to-Speech client
             from google.cloud import texttospeech
-            self.tts_client = texttospeech.TextToSpeechClient()
+            self.tts_client = texttospeech.TextToSpeechClient(transport=self._grpc_transport(texttospeech.TextToSpeechClient))
             
             # Configure speech recognition
             self.speech_config = speech.RecognitionConfig(
@@ -84,13 +119,13 @@ class GoogleCloudServices:
             
         except ImportError as e:
             error_msg = "Google Cloud Speech libraries not installed. Please run: pip install google-cloud-speech google-cloud-texttospeech"
-            logger.error(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             self.config_errors.append(error_msg)
             raise ConfigurationError(error_msg)
             
         except Exception as e:
             error_msg = f"Failed to initialize Google Cloud Services: {str(e)}"
-            logger.error(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             self.config_errors.append(error_msg)
             raise ConfigurationError(error_msg)
     
@@ -127,7 +162,7 @@ For testing without Google Cloud, the app will use fallback text-only mode.
         try:
             with open(creds_path, 'r') as f:
                 json.load(f)
-            logger.info(f"✅ Google Cloud credentials validated: {creds_path}")
+            logger.info("✅ Google Cloud credentials validated: %s", creds_path)
         except json.JSONDecodeError:
             error_msg = f"❌ Invalid JSON format in credentials file: {creds_path}"
             logger.error(error_msg)
@@ -169,7 +204,7 @@ To enable Google Cloud Services:
         """
         if not self.is_configured:
             error_msg = "Speech-to-Text service not available - Google Cloud not configured"
-            logger.error(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             return None, {"error": error_msg, "service": "unavailable"}
         
         try:
@@ -178,7 +213,7 @@ To enable Google Cloud Services:
             # Validate audio data
             if not audio_bytes or len(audio_bytes) == 0:
                 error_msg = "No audio data provided"
-                logger.error(f"❌ {error_msg}")
+                logger.error("❌ %s", error_msg)
                 return None, {"error": error_msg, "audio": "empty"}
             
             # Create audio object
@@ -196,7 +231,7 @@ To enable Google Cloud Services:
                     use_enhanced=True,
                 )
             
-            logger.info(f"🎤 Processing speech-to-text (language: {language_code}, audio size: {len(audio_bytes)} bytes)")
+            logger.info("Processing speech-to-text (language: %s, audio size: %s bytes)", language_code, len(audio_bytes))
             
             # Perform the transcription
             response = self.speech_client.recognize(config=config, audio=audio)
@@ -208,7 +243,7 @@ To enable Google Cloud Services:
                 # Safely access alternatives and confidence
                 if not result.alternatives:
                     error_msg = "No transcription alternatives available"
-                    logger.error(f"❌ {error_msg}")
+                    logger.error("❌ %s", error_msg)
                     return None, {"error": error_msg, "alternatives": "empty"}
                 
                 transcript = result.alternatives[0].transcript
@@ -225,29 +260,32 @@ To enable Google Cloud Services:
                 }
                 
                 confidence_str = f"{confidence:.2f}" if confidence is not None else "unknown"
-                logger.info(f"✅ Transcription successful (confidence: {confidence_str}): {transcript}")
+                logger.info("Transcription successful (confidence: %s): %s", confidence_str, transcript)
                 return transcript.strip(), metadata
             
             else:
                 error_msg = "No speech detected in audio"
-                logger.warning(f"⚠️ {error_msg}")
+                logger.warning("⚠️ %s", error_msg)
                 return None, {"error": error_msg, "detection": "no_speech"}
             
         except Exception as e:
             error_msg = f"Speech-to-Text processing failed: {str(e)}"
-            logger.error(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             return None, {"error": error_msg, "exception": str(e)}
     
-    def text_to_speech(self, text: str, voice_name: str = None, language_code: str = "en-US") -> Tuple[Optional[bytes], Dict[str, Any]]:
+    def text_to_speech(self, text: str, voice_name: str = None, language_code: str = "en-US",
+                       audio_encoding: str = "LINEAR16") -> Tuple[Optional[bytes], Dict[str, Any]]:
         """
-        Convert text to speech using Google Cloud Text-to-Speech
+        Convert text to speech using Google Cloud Text-to-Speech.
+        audio_encoding names a texttospeech.AudioEncoding; use MP3 or OGG_OPUS for
+        audio that is only played back in a browser
         
         Returns:
             Tuple of (audio_bytes, metadata) where metadata contains voice info, timing, etc.
         """
         if not self.is_configured:
             error_msg = "Text-to-Speech service not available - Google Cloud not configured"
-            logger.error(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             return None, {"error": error_msg, "service": "unavailable"}
         
         try:
@@ -256,7 +294,7 @@ To enable Google Cloud Services:
             # Validate text input
             if not text or not text.strip():
                 error_msg = "No text provided for speech synthesis"
-                logger.error(f"❌ {error_msg}")
+                logger.error("❌ %s", error_msg)
                 return None, {"error": error_msg, "text": "empty"}
             
             # Prepare the text input
@@ -272,60 +310,136 @@ To enable Google Cloud Services:
                     name=voice_name or default_voice_name
                 )
             
-            logger.info(f"🔊 Synthesizing speech (language: {language_code}, text length: {len(text)} chars)")
+            audio_config = self.tts_audio_config
+            if audio_encoding != "LINEAR16":
+                audio_config = texttospeech.AudioConfig(audio_config, audio_encoding=texttospeech.AudioEncoding[audio_encoding])
             
-            # Perform the text-to-speech request
-            response = self.tts_client.synthesize_speech(
-                input=synthesis_input,
-                voice=voice,
-                audio_config=self.tts_audio_config
-            )
+            # Identical text, voice and encoding always synthesize to the same audio
+            cache_key = hashlib.blake2b(
+                f"{voice.name}|{language_code}|{audio_config.audio_encoding}|{text.strip()}".encode(),
+                digest_size=16
+            ).hexdigest()
+            audio_content = self._get_cached_audio(cache_key)
+            cached = audio_content is not None
+            
+            if not cached:
+                logger.info("Synthesizing speech (language: %s, text length: %s chars)", language_code, len(text))
+                
+                # Perform the text-to-speech request
+                response = self.tts_client.synthesize_speech(
+                    input=synthesis_input,
+                    voice=voice,
+                    audio_config=audio_config
+                )
+                audio_content = response.audio_content
+                self._cache_audio(cache_key, audio_content)
             
             metadata = {
                 "text_length": len(text),
                 "language_code": language_code,
                 "voice_name": voice.name,
-                "audio_size_bytes": len(response.audio_content),
+                "audio_size_bytes": len(audio_content),
                 "processing_time": datetime.now().isoformat(),
-                "audio_format": "LINEAR16",
-                "sample_rate": 16000
+                "audio_format": audio_encoding,
+                "sample_rate": 16000,
+                "cached": cached
             }
             
-            logger.info(f"✅ Speech synthesis successful (audio size: {len(response.audio_content)} bytes)")
-            return response.audio_content, metadata
+            logger.info("Speech synthesis successful (audio size: %s bytes, cached: %s)", len(audio_content), cached)
+            return audio_content, metadata
             
         except Exception as e:
             error_msg = f"Text-to-Speech synthesis failed: {str(e)}"
-            logger.error(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             return None, {"error": error_msg, "exception": str(e)}
     
-    def streaming_speech_to_text(self, audio_stream):
+    def _get_cached_audio(self, cache_key: str) -> Optional[bytes]:
+        """Look up synthesized audio in memory, then on disk"""
+        with self.tts_cache_lock:
+            audio = self.tts_cache.get(cache_key)
+        if audio is not None:
+            return audio
+        
+        path = os.path.join(self.tts_cache_dir, f"{cache_key}.audio")
+        try:
+            with open(path, 'rb') as f:
+                audio = f.read()
+            os.utime(path)  # Refresh mtime so disk eviction stays LRU
+        except OSError:
+            return None
+        
+        with self.tts_cache_lock:
+            self.tts_cache[cache_key] = audio
+        return audio
+    
+    def _cache_audio(self, cache_key: str, audio: bytes):
+        """Store synthesized audio in memory and on disk, periodically evicting the oldest files"""
+        with self.tts_cache_lock:
+            self.tts_cache[cache_key] = audio
+            self.tts_disk_writes += 1
+            sweep = self.tts_disk_writes % self.tts_disk_sweep_interval == 0
+        
+        try:
+            os.makedirs(self.tts_cache_dir, mode=0o700, exist_ok=True)
+            # Write to a temp file in the same directory and rename it into place, so
+            # concurrent readers never see a partially written clip
+            fd, tmp_path = tempfile.mkstemp(dir=self.tts_cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(audio)
+                os.replace(tmp_path, os.path.join(self.tts_cache_dir, f"{cache_key}.audio"))
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            
+            if sweep:
+                self._evict_disk_cache()
+        except OSError as e:
+            logger.warning("⚠️ Failed to write TTS disk cache: %s", e)
+    
+    def _evict_disk_cache(self):
+        """Trim the disk tier back to TTS_DISK_CACHE_MAX_FILES, oldest first"""
+        entries = [entry for entry in os.scandir(self.tts_cache_dir) if entry.name.endswith('.audio')]
+        if len(entries) <= self.tts_disk_cache_max_files:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.tts_disk_cache_max_files]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass  # Already evicted by another worker
+    
+    def streaming_speech_to_text(self, audio_stream, interim_results: bool = True, language_code: str = "en-US"):
         """
         Stream audio and get real-time transcription with enhanced error handling
         """
         if not self.is_configured:
             error_msg = "Streaming Speech-to-Text service not available - Google Cloud not configured"
-            logger.error(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             yield None, True, {"error": error_msg, "service": "unavailable"}
             return
         
         try:
             from google.cloud import speech
             
+            # Always name the language explicitly; the base config is copied, not mutated
+            recognition_config = self.speech_config
+            if language_code != recognition_config.language_code:
+                recognition_config = speech.RecognitionConfig(recognition_config, language_code=language_code)
+            
             config = speech.StreamingRecognitionConfig(
-                config=self.speech_config,
-                interim_results=True,
+                config=recognition_config,
+                interim_results=interim_results,
             )
             
+            # A lazy generator, so audio is sent as it arrives rather than after the stream ends
             audio_generator = (speech.StreamingRecognizeRequest(audio_content=chunk)
                              for chunk in audio_stream)
             
-            requests = (speech.StreamingRecognizeRequest(streaming_config=config),
-                       *audio_generator)
+            logger.info("🎤 Starting streaming speech recognition (language: %s)...", language_code)
             
-            logger.info("🎤 Starting streaming speech recognition...")
-            
-            responses = self.speech_client.streaming_recognize(requests)
+            # SpeechClient's helper sends the config request itself, ahead of the audio
+            responses = self.speech_client.streaming_recognize(config=config, requests=audio_generator)
             
             for response in responses:
                 for result in response.results:
@@ -347,9 +461,66 @@ To enable Google Cloud Services:
                     
         except Exception as e:
             error_msg = f"Streaming speech-to-text failed: {str(e)}"
-            logger.error(f"❌ {error_msg}")
+            logger.error("❌ %s", error_msg)
             yield None, True, {"error": error_msg, "exception": str(e)}
     
+    def transcribe_stream(self, audio_chunks, on_interim: Optional[Callable[[str], None]] = None,
+                          language_code: str = "en-US") -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Transcribe a complete clip supplied as an iterable of byte chunks, so callers
+        never need the whole clip in a single buffer. If on_interim is given, it is
+        called with the partial transcript so far as recognition progresses
+        
+        Returns:
+            Tuple of (transcript, metadata) like speech_to_text
+        """
+        audio_size = 0
+        
+        def counted_chunks():
+            nonlocal audio_size
+            for chunk in audio_chunks:
+                audio_size += len(chunk)
+                yield chunk
+        
+        transcripts = []
+        confidences = []
+        interim_results = on_interim is not None
+        results = self.streaming_speech_to_text(counted_chunks(), interim_results=interim_results, language_code=language_code)
+        for transcript, is_final, metadata in results:
+            if "error" in metadata:
+                return None, metadata
+            if is_final and transcript:
+                transcripts.append(transcript.strip())
+                if metadata.get("confidence") is not None:
+                    confidences.append(metadata["confidence"])
+            elif interim_results and transcript:
+                on_interim(" ".join(transcripts + [transcript.strip()]))
+        
+        if not transcripts:
+            logger.warning("⚠️ No speech detected in audio")
+            return None, {"detection": "no_speech", "audio_size_bytes": audio_size}
+        
+        transcript = " ".join(transcripts)
+        logger.info("Streaming transcription successful (%s segment(s)): %s", len(transcripts), transcript)
+        return transcript, {
+            "confidence": sum(confidences) / len(confidences) if confidences else None,
+            "language_code": language_code,
+            "audio_size_bytes": audio_size,
+            "processing_time": datetime.now().isoformat(),
+            "is_final": True,
+            "segments": len(transcripts)
+        }
+    
+    def warmup(self):
+        """Open the gRPC channels and prime TTS so the first request skips connection setup"""
+        if not self.is_configured:
+            return
+        
+        import grpc
+        for client in (self.speech_client, self.tts_client):
+            grpc.channel_ready_future(client.transport.grpc_channel).result(timeout=10)
+        self.tts_client.list_voices(language_code="en-US")
+    
     def test_services(self) -> Dict[str, Any]:
         """Test both speech services with sample data"""
         test_results = {
@@ -364,14 +535,9 @@ To enable Google Cloud Services:
         
         # Test Speech-to-Text
         try:
-            # Create a simple test audio (silence)
-            import numpy as np
+            # Create a simple test audio: 1s of 16-bit silence
             sample_rate = 16000
-            duration = 1.0
-            audio_data = np.zeros(int(sample_rate * duration), dtype=np.int16)
-            
-            # Convert to bytes
-            audio_bytes = audio_data.tobytes()
+            audio_bytes = bytes(2 * sample_rate)
             
             transcript, metadata = self.speech_to_text(audio_bytes)
             if "error" in metadata:
@@ -411,5 +577,5 @@ To enable Google Cloud Services:
 try:
     google_services = GoogleCloudServices()
 except Exception as e:
-    logger.error(f"Failed to initialize Google Cloud Services: {e}")
+    logger.error("Failed to initialize Google Cloud Services: %s", e)
     google_services = None
@@ -6,9 +6,13 @@ Integrates SileroVAD, Google Cloud STT/TTS, LLM processing, and database storage
 
 import grpc
 from concurrent import futures
+import os
 import uuid
 import logging
 import io
+import queue
+import threading
+import time
 
 # Import generated protobuf classes
 import voice_assistant_pb2
@@ -17,15 +21,80 @@ import voice_assistant_pb2_grpc
 # Import our custom processors
 from vad_processor import vad_processor
 from google_services import google_services
-from llm_processor import llm_processor
+from llm_processor import get_llm_processor
 
 # Import database services
 from models import conversation_service, session_service
 
 # Setup logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
 logger = logging.getLogger(__name__)
 
+# Turns are persisted off the request path, in batches of up to this many per flush
+DB_FLUSH_BATCH_SIZE = 64
+DB_FLUSH_INTERVAL = 0.2  # seconds
+
+class DBWriteBehind:
+    """
+    Background writer for conversation turns. Each flush upserts every distinct
+    session once (which also bumps its last_activity) and inserts all queued
+    records in a single bulk insert, instead of three round-trips per turn.
+    """
+    
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="db-write-behind", daemon=True)
+        self.thread.start()
+    
+    def submit(self, record: dict):
+        """Queue a conversation record (create_conversation_record keyword arguments)"""
+        self.queue.put(record)
+    
+    def close(self, timeout: float = 10):
+        """Flush everything queued so far and stop the writer"""
+        self.queue.put(None)
+        self.thread.join(timeout)
+    
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + DB_FLUSH_INTERVAL
+            while len(batch) < DB_FLUSH_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            # None is the shutdown sentinel; anything queued before it is still written
+            if None in batch:
+                stopping = True
+                batch = [record for record in batch if record is not None]
+                while True:
+                    try:
+                        record = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is not None:
+                        batch.append(record)
+            if batch:
+                self._flush(batch)
+    
+    @staticmethod
+    def _flush(batch):
+        sessions = {record["session_id"]: record["user_id"] for record in batch}
+        for session_id, user_id in sessions.items():
+            try:
+                session_service.create_user_session(session_id, user_id)
+            except Exception as e:
+                logger.error("Error saving session %s: %s", session_id, e)
+        try:
+            conversation_service.create_conversation_records(batch)
+        except Exception as e:
+            logger.error("Error saving %s conversation(s): %s", len(batch), e)
+
 class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
     """
     Main gRPC servicer for the Voice Assistant
@@ -34,6 +103,7 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
     
     def __init__(self):
         self.active_sessions = {}  # Track active sessions
+        self.db_writer = DBWriteBehind()
         
     def ProcessVoice(self, request, context):
         """
@@ -41,22 +111,15 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
         Takes audio input, processes through full pipeline, returns audio response
         """
         try:
-            logger.info(f"Processing voice request for session: {request.session_id}")
-            
-            # Step 1: Voice Activity Detection
-            if not vad_processor.is_speech_present(request.audio_data):
-                return voice_assistant_pb2.AudioResponse(
-                    success=False,
-                    error_message="No speech detected in audio",
-                    session_id=request.session_id
-                )
+            logger.info("Processing voice request for session: %s", request.session_id)
             
-            # Step 2: Extract speech segments using SileroVAD
+            # Steps 1-2: Voice Activity Detection and speech segment extraction with
+            # SileroVAD, in one sweep over the audio; no segments means no speech
             speech_segments = vad_processor.extract_speech_segments(request.audio_data)
             if not speech_segments:
                 return voice_assistant_pb2.AudioResponse(
                     success=False,
-                    error_message="Failed to extract speech segments",
+                    error_message="No speech detected in audio",
                     session_id=request.session_id
                 )
             
@@ -72,7 +135,7 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
                     session_id=request.session_id
                 )
             
-            logger.info(f"Transcribed text: {transcribed_text}")
+            logger.info("Transcribed text: %s", transcribed_text)
             
             # Step 4: Get conversation history for context
             conversation_history = conversation_service.get_conversation_history(
@@ -82,7 +145,7 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
             )
             
             # Step 5: Process with LLM
-            llm_response = llm_processor.process_text(
+            llm_response = get_llm_processor().process_text(
                 transcribed_text, 
                 request.user_id, 
                 request.session_id,
@@ -92,7 +155,7 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
             if not llm_response:
                 llm_response = "I'm sorry, I couldn't process your request."
             
-            logger.info(f"LLM response: {llm_response}")
+            logger.info("LLM response: %s", llm_response)
             
             # Step 6: Text-to-Speech using Google Cloud TTS
             response_audio = google_services.text_to_speech(llm_response)
@@ -105,21 +168,17 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
                     transcribed_text=transcribed_text
                 )
             
-            # Step 7: Save to database using services
-            conversation_service.create_conversation_record(
-                user_id=request.user_id,
-                session_id=request.session_id,
-                audio_input=request.audio_data,
-                text_input=transcribed_text,
-                text_response=llm_response,
-                audio_response=response_audio,
-                sample_rate=request.sample_rate,
-                audio_format=voice_assistant_pb2.AudioFormat.Name(request.format).lower()
-            )
-            
-            # Create or update session
-            session_service.create_user_session(request.session_id, request.user_id)
-            session_service.update_session_activity(request.session_id)
+            # Step 7: Queue the turn; the session upsert and insert happen in the next batch
+            self.db_writer.submit({
+                "user_id": request.user_id,
+                "session_id": request.session_id,
+                "audio_input": request.audio_data,
+                "text_input": transcribed_text,
+                "text_response": llm_response,
+                "audio_response": response_audio,
+                "sample_rate": request.sample_rate,
+                "audio_format": voice_assistant_pb2.AudioFormat.Name(request.format).lower()
+            })
             
             # Step 8: Return complete response
             return voice_assistant_pb2.AudioResponse(
@@ -132,7 +191,7 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
                 success=True
             )                
         except Exception as e:
-            logger.error(f"Error in ProcessVoice: {e}")
+            logger.error("Error in ProcessVoice: %s", e)
             return voice_assistant_pb2.AudioResponse(
                 success=False,
                 error_message=f"Internal server error: {str(e)}",
@@ -151,7 +210,7 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
             for chunk in request_iterator:
                 if session_id is None:
                     session_id = chunk.session_id
-                    logger.info(f"Starting stream for session: {session_id}")
+                    logger.info("Starting stream for session: %s", session_id)
                 
                 # Buffer the audio chunks
                 audio_buffer.write(chunk.chunk_data)
@@ -159,7 +218,7 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
                 
                 # If this is the final chunk, process the complete audio
                 if chunk.is_final:
-                    logger.info(f"Processing final chunk for session: {session_id}")
+                    logger.info("Processing final chunk for session: %s", session_id)
                     
                     # Get complete audio data
                     complete_audio = audio_buffer.getvalue()
@@ -206,7 +265,7 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
                     sequence_numbers = []
                     
         except Exception as e:
-            logger.error(f"Error in StreamVoice: {e}")
+            logger.error("Error in StreamVoice: %s", e)
             if session_id:
                 yield voice_assistant_pb2.AudioChunk(
                     chunk_data=b"",
@@ -233,18 +292,13 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
             # Convert to protobuf format
             pb_records = []
             for record in records:
-                # Handle audio data conversion
-                audio_input = bytes.fromhex(record.get('audio_input', '')) if record.get('audio_input') else b''
-                audio_response = bytes.fromhex(record.get('audio_response', '')) if record.get('audio_response') else b''
-                
+                # Audio lives in object storage; history carries text only
                 pb_record = voice_assistant_pb2.ConversationRecord(
                     id=record['id'],
                     user_id=record['user_id'],
                     session_id=record['session_id'],
-                    audio_input=audio_input,
                     text_input=record['text_input'],
                     text_response=record['text_response'],
-                    audio_response=audio_response,
                     timestamp=int(record['timestamp']) if isinstance(record['timestamp'], (int, float)) else 0
                 )
                 pb_records.append(pb_record)
@@ -252,7 +306,7 @@ class VoiceAssistantServicer(voice_assistant_pb2_grpc.VoiceAssistantServicer):
             return voice_assistant_pb2.HistoryResponse(records=pb_records)
                 
         except Exception as e:
-            logger.error(f"Error in GetConversationHistory: {e}")
+            logger.error("Error in GetConversationHistory: %s", e)
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(f"Failed to retrieve conversation history: {str(e)}")
             return voice_assistant_pb2.HistoryResponse()
@@ -266,17 +320,19 @@ def serve():
     server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
     
     # Add servicer to server
-    voice_assistant_pb2_grpc.add_VoiceAssistantServicer_to_server(
-        VoiceAssistantServicer(), server
-    )
+    servicer = VoiceAssistantServicer()
+    voice_assistant_pb2_grpc.add_VoiceAssistantServicer_to_server(servicer, server)
     
     # Configure server address
     listen_addr = '0.0.0.0:50051'
     server.add_insecure_port(listen_addr)
     
+    # Warm the VAD model before taking traffic so the first utterance is not slow
+    vad_processor.warmup()
+    
     # Start server
     server.start()
-    logger.info(f"Voice Assistant gRPC server started on {listen_addr}")
+    logger.info("Voice Assistant gRPC server started on %s", listen_addr)
     logger.info("Server is ready to accept connections...")
     
     try:
@@ -284,6 +340,9 @@ def serve():
     except KeyboardInterrupt:
         logger.info("Shutting down server...")
         server.stop(0)
+    finally:
+        # Turns are written behind the responses; flush the tail before exiting
+        servicer.db_writer.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,33 @@
+import threading
+from typing import Optional
+
+import httpx
+
+# Shared HTTP client so outbound API calls reuse warm, multiplexed connections
+_client: Optional[httpx.Client] = None
+_lock = threading.Lock()
+
+def get_http_client() -> httpx.Client:
+    """Get the process-wide HTTP/2 client, creating it on first use"""
+    global _client
+    with _lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.Client(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=1000,
+                    max_keepalive_connections=1000,
+                    keepalive_expiry=60
+                ),
+                timeout=httpx.Timeout(30.0, connect=5.0),
+                trust_env=False
+            )
+        return _client
+
+def close_http_client():
+    """Close the shared HTTP client and release its connections"""
+    global _client
+    with _lock:
+        if _client is not None:
+            _client.close()
+            _client = None
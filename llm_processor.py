@@ -1,10 +1,36 @@
+import openai
 from openai import OpenAI
 import os
-from typing import Optional, Dict, Any
-from dotenv import load_dotenv
+import copy
+import hashlib
+import re
+import threading
+from functools import cache
+from cachetools import LRUCache, TTLCache
+from typing import Optional, Dict, Any, Iterator
+from env_config import load_env
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 import json
+import logging
 
-load_dotenv()
+from http_client import get_http_client
+
+load_env()
+
+logger = logging.getLogger(__name__)
+
+# Whitespace after sentence-ending punctuation; streamed replies are cut here
+SENTENCE_BREAK = re.compile(r'(?<=[.!?])\s+')
+
+# Sentence-ending punctuation ignored at the end of a prompt when keying the response cache
+TRAILING_PUNCTUATION = ".!?"
+
+# Transient API failures worth retrying; bad requests and auth errors are not
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
 
 class LLMProcessor:
     def __init__(self):
@@ -12,13 +38,26 @@ class LLMProcessor:
         api_key = os.getenv('OPENAI_API_KEY')
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable is required")
-        self.client = OpenAI(api_key=api_key)
+        # Retries are handled by _create_completion with jittered backoff
+        self.client = OpenAI(api_key=api_key, http_client=get_http_client(), max_retries=0)
         
         # Default model configuration
         self.model = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+        self.intent_model = os.getenv('OPENAI_INTENT_MODEL', 'gpt-4o-mini')
         self.max_tokens = int(os.getenv('MAX_TOKENS', '150'))
         self.temperature = float(os.getenv('TEMPERATURE', '0.7'))
         
+        # Responses to context-free prompts, keyed by a hash of model and normalized text;
+        # entries expire so time-sensitive answers ("what's today's date") go stale
+        self.response_cache = TTLCache(
+            maxsize=int(os.getenv('LLM_CACHE_SIZE', '4096')),
+            ttl=float(os.getenv('LLM_CACHE_TTL', '3600'))
+        )
+        self.response_cache_lock = threading.Lock()
+        # Intent results keyed by the lowercased, stripped utterance
+        self.intent_cache = LRUCache(maxsize=4096)
+        self.intent_cache_lock = threading.Lock()
+        
         # System prompt for the voice assistant
         self.system_prompt = """
         You are a helpful voice assistant. You should:
@@ -33,12 +72,58 @@ class LLMProcessor:
         indicate what type of information you need and I'll help you retrieve it.
         """
     
+    @retry(
+        stop=stop_after_attempt(4),
+        wait=wait_random_exponential(min=0.5, max=8),
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        reraise=True
+    )
+    def _create_completion(self, **kwargs):
+        """
+        Create a chat completion, retrying transient failures with exponential backoff
+        """
+        return self.client.chat.completions.create(**kwargs)
+    
+    def _cache_key(self, text: str) -> bytes:
+        """
+        Key a context-free prompt on its full text, ignoring only case, spacing and
+        trailing punctuation, so "What's the weather?" and "what's the weather" share
+        one cached reply while "2+2" and "2-2" do not
+        """
+        normalized = " ".join(text.lower().split()).rstrip(TRAILING_PUNCTUATION).rstrip()
+        return hashlib.blake2b(f"{self.model}|{normalized}".encode(), digest_size=16).digest()
+    
+    def warmup(self):
+        """Open a pooled connection to the API with a cheap metadata request"""
+        self.client.models.retrieve(self.model)
+    
+    def ping(self) -> bool:
+        """
+        Send one tiny completion without retries, so health probes report an outage
+        immediately instead of backing off; returns whether the model replied
+        """
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "user", "content": "Test message"}],
+            max_tokens=5
+        )
+        return bool(response.choices and response.choices[0].message.content)
+    
     def process_text(self, text: str, user_id: str, session_id: str, 
                     conversation_history: list = None) -> Optional[str]:
         """
         Process user input text and generate appropriate response
         """
         try:
+            # Only prompts without conversation history are safe to answer from cache
+            cache_key = None
+            if not conversation_history:
+                cache_key = self._cache_key(text)
+                with self.response_cache_lock:
+                    cached_response = self.response_cache.get(cache_key)
+                if cached_response is not None:
+                    return cached_response
+            
             # Build conversation messages
             messages = [{"role": "system", "content": self.system_prompt}]
             
@@ -52,7 +137,7 @@ class LLMProcessor:
             messages.append({"role": "user", "content": text})
             
             # Generate response
-            response = self.client.chat.completions.create(
+            response = self._create_completion(
                 model=self.model,
                 messages=messages,
                 max_tokens=self.max_tokens,
@@ -60,49 +145,84 @@ class LLMProcessor:
                 user=f"{user_id}_{session_id}"
             )
             
-            return response.choices[0].message.content.strip()
+            response_text = response.choices[0].message.content.strip()
+            if cache_key is not None:
+                with self.response_cache_lock:
+                    self.response_cache[cache_key] = response_text
+            return response_text
             
         except Exception as e:
-            print(f"Error in LLM processing: {e}")
+            logger.error("Error in LLM processing: %s", e)
             return "I'm sorry, I encountered an error processing your request. Please try again."
     
-    def analyze_intent(self, text: str) -> Dict[str, Any]:
+    def stream_sentences(self, text: str, user_id: str, session_id: str) -> Iterator[str]:
         """
-        Analyze user intent and extract entities
+        Generate a reply to a context-free prompt, yielding each sentence as soon as it
+        has streamed in so speech synthesis can start before the reply is finished
         """
+        cache_key = self._cache_key(text)
+        with self.response_cache_lock:
+            cached_response = self.response_cache.get(cache_key)
+        if cached_response is not None:
+            yield from (sentence for sentence in SENTENCE_BREAK.split(cached_response) if sentence)
+            return
+        
+        sentences = []
         try:
-            intent_prompt = f"""
-            Analyze the following user input and extract:
-            1. Intent (e.g., question, request, command, greeting, etc.)
-            2. Entities (names, dates, locations, etc.)
-            3. Confidence level (high, medium, low)
-            4. Required actions or information needed
-            
-            User input: "{text}"
-            
-            Respond in JSON format:
-            {{
-                "intent": "intent_type",
-                "entities": {{"entity_type": "entity_value"}},
-                "confidence": "confidence_level",
-                "actions_needed": ["action1", "action2"],
-                "info_needed": ["info1", "info2"]
-            }}
-            """
-            
-            response = self.client.chat.completions.create(
+            stream = self._create_completion(
                 model=self.model,
-                messages=[{"role": "user", "content": intent_prompt}],
-                max_tokens=200,
-                temperature=0.3
+                messages=[
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": text}
+                ],
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                user=f"{user_id}_{session_id}",
+                stream=True
             )
             
-            # Parse JSON response
-            result = json.loads(response.choices[0].message.content)
-            return result
+            pending = ""
+            for chunk in stream:
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                pending += chunk.choices[0].delta.content
+                # Everything before the last break is a complete sentence
+                *complete, pending = SENTENCE_BREAK.split(pending)
+                for sentence in complete:
+                    if sentence.strip():
+                        sentences.append(sentence.strip())
+                        yield sentences[-1]
+            if pending.strip():
+                sentences.append(pending.strip())
+                yield sentences[-1]
             
         except Exception as e:
-            print(f"Error in intent analysis: {e}")
+            logger.error("Error in LLM streaming: %s", e)
+            if not sentences:
+                yield "I'm sorry, I encountered an error processing your request. Please try again."
+            return
+        
+        with self.response_cache_lock:
+            self.response_cache[cache_key] = " ".join(sentences)
+    
+    def analyze_intent(self, text: str) -> Dict[str, Any]:
+        """
+        Analyze user intent and extract entities
+        """
+        try:
+            # Intent rarely changes for the same utterance, so results are cached on the
+            # normalized text; the model still sees the original casing for entities
+            cache_key = text.lower().strip()
+            with self.intent_cache_lock:
+                intent = self.intent_cache.get(cache_key)
+            if intent is None:
+                intent = self._classify_intent(text.strip())
+                with self.intent_cache_lock:
+                    self.intent_cache[cache_key] = intent
+            return copy.deepcopy(intent)
+            
+        except Exception as e:
+            logger.error("Error in intent analysis: %s", e)
             return {
                 "intent": "unknown",
                 "entities": {},
@@ -111,6 +231,40 @@ class LLMProcessor:
                 "info_needed": []
             }
     
+    def _classify_intent(self, text: str) -> Dict[str, Any]:
+        """
+        Classify an utterance with the intent model in JSON mode
+        """
+        intent_prompt = f"""
+        Analyze the following user input and extract:
+        1. Intent (e.g., question, request, command, greeting, etc.)
+        2. Entities (names, dates, locations, etc.)
+        3. Confidence level (high, medium, low)
+        4. Required actions or information needed
+        
+        User input: "{text}"
+        
+        Respond in JSON format:
+        {{
+            "intent": "intent_type",
+            "entities": {{"entity_type": "entity_value"}},
+            "confidence": "confidence_level",
+            "actions_needed": ["action1", "action2"],
+            "info_needed": ["info1", "info2"]
+        }}
+        """
+        
+        response = self._create_completion(
+            model=self.intent_model,
+            messages=[{"role": "user", "content": intent_prompt}],
+            max_tokens=150,
+            temperature=0.3,
+            response_format={"type": "json_object"}
+        )
+        
+        # JSON mode guarantees a parseable object
+        return json.loads(response.choices[0].message.content)
+    
     def generate_response_with_context(self, text: str, context_data: Dict[str, Any], 
                                      user_id: str, session_id: str) -> Optional[str]:
         """
@@ -127,7 +281,7 @@ class LLMProcessor:
             Keep the response conversational and suitable for speech output.
             """
             
-            response = self.client.chat.completions.create(
+            response = self._create_completion(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": self.system_prompt},
@@ -141,7 +295,7 @@ class LLMProcessor:
             return response.choices[0].message.content.strip()
             
         except Exception as e:
-            print(f"Error in context-aware response generation: {e}")
+            logger.error("Error in context-aware response generation: %s", e)
             return "I'm sorry, I couldn't process your request with the available information."
     
     def summarize_conversation(self, conversation_history: list) -> str:
@@ -152,11 +306,11 @@ class LLMProcessor:
             if not conversation_history:
                 return "No conversation history available."
             
-            # Prepare conversation text
-            conversation_text = ""
-            for record in conversation_history:
-                conversation_text += f"User: {record.text_input}\n"
-                conversation_text += f"Assistant: {record.text_response}\n\n"
+            # Prepare conversation text in a single pass
+            conversation_text = "\n\n".join(
+                f"User: {record.text_input}\nAssistant: {record.text_response}"
+                for record in conversation_history
+            )
             
             summary_prompt = f"""
             Summarize the following conversation in 2-3 sentences:
@@ -166,7 +320,7 @@ class LLMProcessor:
             Focus on the main topics discussed and any important information exchanged.
             """
             
-            response = self.client.chat.completions.create(
+            response = self._create_completion(
                 model=self.model,
                 messages=[{"role": "user", "content": summary_prompt}],
                 max_tokens=100,
@@ -176,8 +330,13 @@ class LLMProcessor:
             return response.choices[0].message.content.strip()
             
         except Exception as e:
-            print(f"Error in conversation summarization: {e}")
+            logger.error("Error in conversation summarization: %s", e)
             return "Unable to summarize conversation."
 
-# Singleton instance
-llm_processor = LLMProcessor()
+@cache
+def get_llm_processor() -> LLMProcessor:
+    """
+    Return the shared LLMProcessor, constructing it on first use so that
+    importing this module does not build the OpenAI client
+    """
+    return LLMProcessor()
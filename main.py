@@ -1,16 +1,31 @@
-from fastapi import FastAPI, WebSocket, HTTPException, UploadFile, Form, Depends
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, WebSocket, HTTPException, UploadFile, Depends, Request, Response
+from pydantic import BaseModel, Field
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from starlette.middleware.gzip import GZipMiddleware
 from sqlalchemy.orm import Session
-import uuid
+from uuid_utils import uuid7
 import os
+import uuid
+import asyncio
+import queue
+import threading
 import uvicorn
 import io
-from dotenv import load_dotenv
+from env_config import load_env
 import json
+import orjson
+import msgpack
+import brotli
 import logging
+import hashlib
+from cachetools import TTLCache
+import time
+from datetime import datetime, timezone
+
+load_env()
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "WARNING").upper())
 logger = logging.getLogger(__name__)
 
 # Import database services
@@ -23,15 +38,20 @@ except ImportError:
     def get_db(): yield None
     DATABASE_AVAILABLE = False
     
+class MockLLMProcessor:
+    def process_text(self, text, user_id, session_id):
+        return f"Echo: {text} (processed by mock LLM)"
+
 try:
-    from llm_processor import llm_processor
+    from llm_processor import get_llm_processor
+    # Build the processor once up front so a missing OPENAI_API_KEY selects the mock
+    # here instead of failing every request
+    get_llm_processor()
     LLM_AVAILABLE = True
-except ImportError:
-    logger.warning("LLM processor not available - using mock responses")
-    class MockLLMProcessor:
-        def process_text(self, text, user_id, session_id):
-            return f"Echo: {text} (processed by mock LLM)"
-    llm_processor = MockLLMProcessor()
+except (ImportError, ValueError) as e:
+    logger.warning("LLM processor not available (%s) - using mock responses", e)
+    _mock_llm_processor = MockLLMProcessor()
+    def get_llm_processor(): return _mock_llm_processor
     LLM_AVAILABLE = False
 
 # Import Google Cloud Services
@@ -39,24 +59,128 @@ try:
     from google_services import google_services
     GOOGLE_SERVICES_AVAILABLE = True
 except Exception as e:
-    logger.error(f"Google Cloud Services not available: {e}")
+    logger.error("Google Cloud Services not available: %s", e)
     GOOGLE_SERVICES_AVAILABLE = False
     google_services = None
 
-load_dotenv()
+# Per-message WebSocket logs are sampled so logging doesn't bound throughput
+WS_LOG_SAMPLE_RATE = 50
+
+# Results of /services/test, shared by monitoring polls
+SERVICE_TEST_TTL = 30
+service_test_cache = TTLCache(maxsize=1, ttl=SERVICE_TEST_TTL)
+
+# Background conversation writes: max rows per insert and max wait for a batch to fill
+DB_FLUSH_BATCH_SIZE = 64
+DB_FLUSH_INTERVAL = 0.2  # seconds
+
+# Uploaded audio is fed to streaming recognition in chunks of this size (API limit is 25KB)
+UPLOAD_CHUNK_SIZE = 16 * 1024
+
+# Request bodies above this are rejected with 413 before they are read
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 25 * 1024 * 1024))
+
+# Audio frames buffered per WebSocket before reads pause and back-pressure reaches the client
+WS_AUDIO_QUEUE_SIZE = 16
+WS_MAX_MESSAGE_BYTES = 1024 * 1024
 
 app = FastAPI(
     title="Voice Assistant API",
     description="Enhanced Voice Assistant with Google Cloud Speech Services and OpenAI",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse
 )
 
+# Compress dynamic JSON such as conversation history; responses that already
+# carry a Content-Encoding (pre-compressed static bodies) are left alone
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
+
+class ContentLengthLimitMiddleware:
+    """Reject HTTP requests whose declared body exceeds max_bytes with 413"""
+    
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            for name, value in scope["headers"]:
+                if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                    response = ORJSONResponse(
+                        {"detail": f"Request body exceeds {self.max_bytes} bytes"}, status_code=413
+                    )
+                    await response(scope, receive, send)
+                    return
+        await self.app(scope, receive, send)
+
+app.add_middleware(ContentLengthLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
+
+class TextRequest(BaseModel):
+    """Request body for text processing"""
+    text: str = Field(min_length=1, max_length=8192)
+
+def _warm_llm_processor():
+    """Construct the LLM processor and connect it so the first request doesn't pay for it"""
+    try:
+        get_llm_processor().warmup()
+        logger.info("✅ LLM processor initialized")
+    except Exception as e:
+        logger.error("LLM processor initialization failed: %s", e)
+
+def _warm_database():
+    """Open the Supabase HTTP session with a trivial query"""
+    try:
+        from supabase_client import supabase_client
+        supabase_client.test_connection()
+    except Exception as e:
+        logger.error("Database warm-up failed: %s", e)
+
+def _warm_google_services():
+    """Connect the Google Speech and TTS channels"""
+    try:
+        google_services.warmup()
+        logger.info("✅ Google Cloud channels connected")
+    except Exception as e:
+        logger.error("Google Cloud warm-up failed: %s", e)
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize application on startup"""
     logger.info("🚀 Starting Voice Assistant API...")
+    
+    # Pay DNS, TLS and channel setup for every backend before serving traffic
+    warmups = []
+    if LLM_AVAILABLE:
+        warmups.append(asyncio.to_thread(_warm_llm_processor))
+    if DATABASE_AVAILABLE:
+        warmups.append(asyncio.to_thread(_warm_database))
+    if GOOGLE_SERVICES_AVAILABLE and google_services:
+        warmups.append(asyncio.to_thread(_warm_google_services))
+    await asyncio.gather(*warmups)
+    
+    if LLM_AVAILABLE:
+        # Caps in-flight OpenAI calls; the default matches the default thread pool size,
+        # so no call holds a slot while waiting for a worker thread
+        app.state.llm_semaphore = asyncio.Semaphore(
+            int(os.getenv("LLM_MAX_CONCURRENCY", min(32, (os.cpu_count() or 1) + 4)))
+        )
+    
     create_tables()  # Ensure tables are created
     
+    # Session and conversation writes are batched off the request path
+    if DATABASE_AVAILABLE:
+        app.state.db_queue = asyncio.Queue()
+        app.state.db_flusher = asyncio.create_task(_db_flusher(app.state.db_queue))
+    
+    # Service flags are fixed after import, so serialize static payloads once
+    app.state.root_json = orjson.dumps(build_root_info())
+    app.state.root_json_br = brotli.compress(app.state.root_json, quality=11)
+    app.state.services_status_json = orjson.dumps(build_services_status())
+    app.state.services_status_json_br = brotli.compress(app.state.services_status_json, quality=11)
+    google_status, google_details = build_google_status()
+    app.state.google_configured = google_status == "configured"
+    app.state.health_services = build_health_services(google_status, google_details)
+    
     # Log service availability
     services_status = {
         "database": DATABASE_AVAILABLE,
@@ -64,7 +188,7 @@ async def startup_event():
         "google_cloud": GOOGLE_SERVICES_AVAILABLE
     }
     
-    logger.info(f"📊 Services Status: {services_status}")
+    logger.info("📊 Services Status: %s", services_status)
     
     if GOOGLE_SERVICES_AVAILABLE and google_services:
         status = google_services.get_service_status()
@@ -73,93 +197,308 @@ async def startup_event():
         else:
             logger.warning("⚠️ Google Cloud Services not properly configured")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared resources on shutdown"""
+    if DATABASE_AVAILABLE:
+        # Let the flusher write its in-flight batch and everything still queued, then exit
+        app.state.db_queue.put_nowait(None)
+        await app.state.db_flusher
+    
+    if LLM_AVAILABLE:
+        from http_client import close_http_client
+        close_http_client()
+
+async def _generate_response(text: str, user_id: str, session_id: str) -> str:
+    """Run the LLM for one conversational turn"""
+    if LLM_AVAILABLE:
+        async with app.state.llm_semaphore:
+            return await asyncio.to_thread(get_llm_processor().process_text, text, user_id, session_id)
+    return f"Mock response: {text} (LLM not available)"
+
+class Singleflight:
+    """
+    Coalesce concurrent identical calls: the first caller starts the work and
+    later callers with the same key await the same result
+    """
+    
+    def __init__(self):
+        self.inflight: dict = {}
+    
+    async def do(self, key, make_coro):
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(make_coro())
+            self.inflight[key] = future
+            future.add_done_callback(lambda _: self.inflight.pop(key, None))
+        # Shielded so one caller disconnecting doesn't cancel the work for the others
+        return await asyncio.shield(future)
+
+text_singleflight = Singleflight()
+
+async def _respond_with_speech(text: str, user_id: str, session_id: str):
+    """Generate the LLM reply for a context-free prompt and synthesize it"""
+    response_text = await _generate_response(text, user_id, session_id)
+    
+    # Generate audio response if Google Cloud TTS is available
+    audio_response = None
+    tts_metadata = {}
+    
+    if GOOGLE_SERVICES_AVAILABLE and google_services:
+        logger.info("Generating audio response with Google Cloud TTS")
+        audio_response, tts_metadata = await asyncio.to_thread(google_services.text_to_speech, response_text)
+        
+        if not audio_response:
+            logger.warning("⚠️ Failed to generate audio response")
+    
+    return response_text, audio_response, tts_metadata
+
+def _queue_session(session_id: str, user_id: str):
+    """Hand a new session to the background flusher instead of writing inline"""
+    if not DATABASE_AVAILABLE:
+        return
+    app.state.db_queue.put_nowait(("session", {"session_id": session_id, "user_id": user_id}))
+
+def _queue_conversation(user_id: str, session_id: str, audio_input: bytes, text_input: str,
+                        text_response: str, audio_response: bytes):
+    """Hand a conversational turn to the background flusher instead of writing inline"""
+    if not DATABASE_AVAILABLE:
+        return
+    app.state.db_queue.put_nowait(("conversation", {
+        "user_id": user_id,
+        "session_id": session_id,
+        "audio_input": audio_input,
+        "text_input": text_input,
+        "text_response": text_response,
+        "audio_response": audio_response
+    }))
+
+def _flush_db_writes(batch):
+    """Persist queued sessions, then turns, and bump activity once per distinct session"""
+    sessions = [item for kind, item in batch if kind == "session"]
+    records = [item for kind, item in batch if kind == "conversation"]
+    try:
+        session_service.create_user_sessions(sessions)
+    except Exception as e:
+        logger.error("Error creating %s session(s): %s", len(sessions), e)
+    if not records:
+        return
+    try:
+        conversation_service.create_conversation_records(records)
+        session_service.update_sessions_activity(list({record["session_id"] for record in records}))
+    except Exception as e:
+        logger.error("Error saving %s conversation(s): %s", len(records), e)
+
+async def _db_flusher(db_queue: asyncio.Queue):
+    """Drain queued turns and write them in batches until a None sentinel arrives"""
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        batch = [await db_queue.get()]
+        deadline = loop.time() + DB_FLUSH_INTERVAL
+        while len(batch) < DB_FLUSH_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(db_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # None is the shutdown sentinel; anything queued before it is still written
+        if None in batch:
+            stopping = True
+            batch = [item for item in batch if item is not None]
+            while not db_queue.empty():
+                item = db_queue.get_nowait()
+                if item is not None:
+                    batch.append(item)
+        if batch:
+            await asyncio.to_thread(_flush_db_writes, batch)
+
+def _run_streaming_recognition(audio_chunks: queue.Queue, loop: asyncio.AbstractEventLoop,
+                               transcripts: asyncio.Queue):
+    """
+    Feed queued audio chunks into Google streaming recognition (runs in a worker thread)
+    and hand every result back to the event loop as (transcript, is_final, error).
+    A None chunk ends the stream.
+    """
+    try:
+        for transcript, is_final, metadata in google_services.streaming_speech_to_text(iter(audio_chunks.get, None)):
+            if "error" in metadata:
+                loop.call_soon_threadsafe(transcripts.put_nowait, (None, True, metadata["error"]))
+            elif transcript:
+                loop.call_soon_threadsafe(transcripts.put_nowait, (transcript, is_final, None))
+    finally:
+        loop.call_soon_threadsafe(transcripts.put_nowait, None)
+
+async def _send_envelope(websocket: WebSocket, frame_type: str, data, **extra):
+    """Send a msgpack {t, d} envelope as a single binary frame"""
+    await websocket.send_bytes(msgpack.packb({"t": frame_type, "d": data, **extra}))
+
+async def _answer_transcripts(websocket: WebSocket, transcripts: asyncio.Queue, user_id: str, session_id: str):
+    """Forward transcripts to the client and answer each final one with text and speech"""
+    while (item := await transcripts.get()) is not None:
+        transcript, is_final, error = item
+        if error:
+            await _send_envelope(websocket, "error", error)
+            continue
+        await _send_envelope(websocket, "transcript", transcript, final=is_final)
+        if not is_final:
+            continue
+        
+        response_text = await _generate_response(transcript, user_id, session_id)
+        await _send_envelope(websocket, "text", response_text)
+        
+        audio_response, tts_metadata = await asyncio.to_thread(google_services.text_to_speech, response_text)
+        if audio_response:
+            await _send_envelope(websocket, "audio", audio_response)
+        else:
+            logger.warning("⚠️ Failed to generate audio response")
+        
+        _queue_conversation(user_id, session_id, b"", transcript, response_text, audio_response or b"")
+
 @app.websocket("/ws/audio")
 async def websocket_endpoint(websocket: WebSocket):
-    """WebSocket endpoint for real-time audio processing"""
+    """
+    WebSocket endpoint for real-time audio processing
+    
+    Binary frames carry a msgpack envelope {"t": type, "d": data}:
+    - {"t": "text", "d": str} is answered with {"t": "text", "d": response}
+    - {"t": "audio", "d": bytes} is raw 16kHz mono LINEAR16 audio streamed into
+      Google Cloud Speech-to-Text while the client is still speaking; transcripts
+      come back as {"t": "transcript", "d": str, "final": bool} and each final one
+      is answered with a "text" envelope plus an {"t": "audio", "d": bytes} envelope
+    Plain text frames are still answered with a plain text frame.
+    """
     await websocket.accept()
-    session_id = str(uuid.uuid4())
+    session_id = str(uuid7())
     user_id = "default_user"
     
-    logger.info(f"🔌 WebSocket connection established for session: {session_id}")
+    logger.info("WebSocket connection established for session: %s", session_id)
     
     # Create user session if database is available
-    if DATABASE_AVAILABLE:
-        try:
-            session_service.create_user_session(session_id, user_id)
-        except Exception as e:
-            logger.error(f"Error creating session: {e}")
+    _queue_session(session_id, user_id)
+    
+    audio_chunks = None  # Feeds the recognizer thread once audio starts arriving
+    responder = None
+    message_count = 0
     
     try:
         while True:
-            # For now, expect text input via websocket for testing
-            data = await websocket.receive_text()
-            
-            logger.info(f"📨 Received text via WebSocket: {data[:50]}...")
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
             
-            # Process text with LLM
-            if LLM_AVAILABLE:
-                response_text = llm_processor.process_text(data, user_id=user_id, session_id=session_id)
+            if message.get("bytes") is not None:
+                try:
+                    envelope = msgpack.unpackb(message["bytes"], raw=False)
+                    frame_type, payload = envelope["t"], envelope["d"]
+                except Exception:
+                    await _send_envelope(websocket, "error", "Binary frames must be msgpack {t, d} envelopes")
+                    continue
             else:
-                response_text = f"Mock response: {data} (LLM not available)"
+                frame_type, payload = None, message.get("text") or ""
             
-            # Save conversation to database if available
-            if DATABASE_AVAILABLE:
+            # Audio envelopes: stream into speech recognition
+            if frame_type == "audio":
+                if not (GOOGLE_SERVICES_AVAILABLE and google_services):
+                    await _send_envelope(websocket, "error", "Audio streaming requires Google Cloud Speech services")
+                    continue
+                if audio_chunks is None:
+                    # The recognizer lives as long as the stream, so it gets its own thread
+                    # rather than pinning a slot in the default executor
+                    audio_chunks = queue.Queue(maxsize=WS_AUDIO_QUEUE_SIZE)
+                    transcripts = asyncio.Queue()
+                    threading.Thread(
+                        target=_run_streaming_recognition,
+                        args=(audio_chunks, asyncio.get_running_loop(), transcripts),
+                        daemon=True
+                    ).start()
+                    responder = asyncio.create_task(_answer_transcripts(websocket, transcripts, user_id, session_id))
                 try:
-                    conversation_service.create_conversation_record(
-                        user_id=user_id,
-                        session_id=session_id,
-                        audio_input=b"",  # No audio in websocket text mode
-                        text_input=data,
-                        text_response=response_text,
-                        audio_response=b""  # No audio in websocket text mode
-                    )
-                    # Update session activity
-                    session_service.update_session_activity(session_id)
-                except Exception as e:
-                    logger.error(f"Error saving conversation: {e}")
+                    audio_chunks.put_nowait(payload)
+                except queue.Full:
+                    # Recognizer is behind; stop reading so back-pressure reaches the client's socket
+                    await asyncio.to_thread(audio_chunks.put, payload)
+                continue
+            
+            if frame_type not in (None, "text") or not isinstance(payload, str):
+                await _send_envelope(websocket, "error", f"Unsupported frame type: {frame_type}")
+                continue
+            
+            data = payload
+            message_count += 1
+            sampled = message_count % WS_LOG_SAMPLE_RATE == 1
+            if sampled:
+                logger.info("Received text via WebSocket (message %s): %.50s...", message_count, data)
+            
+            # Process text with LLM
+            response_text = await _generate_response(data, user_id, session_id)
+            
+            # Save conversation to database if available (no audio in text mode)
+            _queue_conversation(user_id, session_id, b"", data, response_text, b"")
 
-            # Send response back
-            await websocket.send_text(response_text)
-            logger.info(f"📤 Sent response via WebSocket: {response_text[:50]}...")
+            # Reply in the framing the client used
+            if frame_type == "text":
+                await _send_envelope(websocket, "text", response_text)
+            else:
+                await websocket.send_text(response_text)
+            if sampled:
+                logger.info("Sent response via WebSocket: %.50s...", response_text)
 
     except Exception as e:
-        logger.error(f"WebSocket error: {e}")
+        logger.error("WebSocket error: %s", e)
         await websocket.close(code=1000)
+    finally:
+        # End the recognition stream and stop answering once the client is gone
+        if audio_chunks is not None:
+            # Drop audio the recognizer hasn't taken yet so the sentinel always fits
+            while not audio_chunks.empty():
+                try:
+                    audio_chunks.get_nowait()
+                except queue.Empty:
+                    break
+            audio_chunks.put_nowait(None)
+        if responder is not None:
+            responder.cancel()
 
 @app.post("/upload-audio/")
 async def upload_audio(file: UploadFile):
     """Enhanced audio upload endpoint with Google Cloud Speech processing"""
-    session_id = str(uuid.uuid4())
+    session_id = str(uuid7())
     user_id = "default_user"
     
-    logger.info(f"📁 Processing audio upload: {file.filename}")
+    started = time.monotonic()
+    logger.info("Processing audio upload: %s", file.filename)
     
     # Create user session if database is available
-    if DATABASE_AVAILABLE:
-        try:
-            session_service.create_user_session(session_id, user_id)
-        except Exception as e:
-            logger.error(f"Error creating session: {e}")
+    _queue_session(session_id, user_id)
     
     try:
-        # Read file into bytes
-        contents = await file.read()
+        # Starlette has already spooled the upload to a temporary file; work from it directly
+        file.file.seek(0, os.SEEK_END)
+        audio_size = file.file.tell()
+        file.file.seek(0)
         
-        if not contents:
+        if not audio_size:
             raise HTTPException(status_code=400, detail="Empty audio file provided")
+        # Chunked uploads carry no Content-Length, so the middleware can't catch them
+        if audio_size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Audio file exceeds {MAX_UPLOAD_BYTES} bytes")
         
         # Process with Google Cloud Speech-to-Text if available
         transcript = None
         transcription_metadata = {}
         
         if GOOGLE_SERVICES_AVAILABLE and google_services:
-            logger.info(f"🎤 Transcribing audio with Google Cloud (size: {len(contents)} bytes)")
-            transcript, transcription_metadata = google_services.speech_to_text(contents)
+            logger.info("Transcribing audio with Google Cloud (size: %s bytes)", audio_size)
+            audio_chunks = iter(lambda: file.file.read(UPLOAD_CHUNK_SIZE), b"")
+            transcript, transcription_metadata = await asyncio.to_thread(google_services.transcribe_stream, audio_chunks)
             
             if not transcript:
                 if "error" in transcription_metadata:
                     error_msg = f"Transcription failed: {transcription_metadata['error']}"
-                    logger.error(f"❌ {error_msg}")
+                    logger.error("❌ %s", error_msg)
                     raise HTTPException(status_code=500, detail=error_msg)
                 else:
                     logger.warning("⚠️ No speech detected in audio")
@@ -170,37 +509,23 @@ async def upload_audio(file: UploadFile):
             logger.warning("⚠️ Using mock transcript - Google Cloud Services not available")
         
         # Process text with LLM
-        if LLM_AVAILABLE:
-            response_text = llm_processor.process_text(transcript, user_id=user_id, session_id=session_id)
-        else:
-            response_text = f"Mock response: {transcript} (LLM not available)"
+        response_text = await _generate_response(transcript, user_id, session_id)
         
         # Generate audio response if Google Cloud TTS is available
         audio_response = None
         tts_metadata = {}
         
         if GOOGLE_SERVICES_AVAILABLE and google_services:
-            logger.info("🔊 Generating audio response with Google Cloud TTS")
-            audio_response, tts_metadata = google_services.text_to_speech(response_text)
+            logger.info("Generating audio response with Google Cloud TTS")
+            audio_response, tts_metadata = await asyncio.to_thread(google_services.text_to_speech, response_text)
             
             if not audio_response:
                 logger.warning("⚠️ Failed to generate audio response")
         
         # Save conversation to database if available
         if DATABASE_AVAILABLE:
-            try:
-                conversation_service.create_conversation_record(
-                    user_id=user_id,
-                    session_id=session_id,
-                    audio_input=contents,
-                    text_input=transcript,
-                    text_response=response_text,
-                    audio_response=audio_response or b""
-                )
-                # Update session activity
-                session_service.update_session_activity(session_id)
-            except Exception as e:
-                logger.error(f"Error saving conversation: {e}")
+            await file.seek(0)
+            _queue_conversation(user_id, session_id, await file.read(), transcript, response_text, audio_response or b"")
 
         # Prepare response
         response_data = {
@@ -227,64 +552,38 @@ async def upload_audio(file: UploadFile):
             response_data["audio_available"] = False
             response_data["message"] = "Audio response not available - Google Cloud TTS not configured"
 
-        logger.info(f"✅ Audio processing completed successfully")
-        return JSONResponse(response_data)
+        logger.info("Audio processing completed in %.0f ms", (time.monotonic() - started) * 1000)
+        return response_data
         
     except HTTPException:
         raise
     except Exception as e:
         error_msg = f"Failed to process audio: {str(e)}"
-        logger.error(f"❌ {error_msg}")
+        logger.error("❌ %s", error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
 
 @app.post("/process-text/")
-async def process_text(text: str = Form(...)):
+async def process_text(body: TextRequest):
     """Enhanced text processing endpoint with audio response generation"""
-    session_id = str(uuid.uuid4())
+    text = body.text
+    session_id = str(uuid7())
     user_id = "default_user"
     
-    logger.info(f"💬 Processing text input: {text[:50]}...")
+    started = time.monotonic()
+    logger.info("Processing text input: %.50s...", text)
     
     # Create user session if database is available
-    if DATABASE_AVAILABLE:
-        try:
-            session_service.create_user_session(session_id, user_id)
-        except Exception as e:
-            logger.error(f"Error creating session: {e}")
+    _queue_session(session_id, user_id)
     
     try:
-        # Process text with LLM
-        if LLM_AVAILABLE:
-            response_text = llm_processor.process_text(text, user_id=user_id, session_id=session_id)
-        else:
-            response_text = f"Mock response: {text} (LLM not available)"
+        # Identical prompts already in flight share one LLM + TTS round trip
+        key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        response_text, audio_response, tts_metadata = await text_singleflight.do(
+            key, lambda: _respond_with_speech(text, user_id, session_id)
+        )
         
-        # Generate audio response if Google Cloud TTS is available
-        audio_response = None
-        tts_metadata = {}
-        
-        if GOOGLE_SERVICES_AVAILABLE and google_services:
-            logger.info("🔊 Generating audio response with Google Cloud TTS")
-            audio_response, tts_metadata = google_services.text_to_speech(response_text)
-            
-            if not audio_response:
-                logger.warning("⚠️ Failed to generate audio response")
-        
-        # Save conversation to database if available
-        if DATABASE_AVAILABLE:
-            try:
-                conversation_service.create_conversation_record(
-                    user_id=user_id,
-                    session_id=session_id,
-                    audio_input=b"",  # No audio input
-                    text_input=text,
-                    text_response=response_text,
-                    audio_response=audio_response or b""
-                )
-                # Update session activity
-                session_service.update_session_activity(session_id)
-            except Exception as e:
-                logger.error(f"Error saving conversation: {e}")
+        # Save conversation to database if available (no audio input)
+        _queue_conversation(user_id, session_id, b"", text, response_text, audio_response or b"")
         
         # Prepare response
         response_data = {
@@ -309,30 +608,55 @@ async def process_text(text: str = Form(...)):
             response_data["audio_available"] = False
             response_data["message"] = "Audio response not available - Google Cloud TTS not configured"
 
-        logger.info(f"✅ Text processing completed successfully")
-        return JSONResponse(response_data)
+        logger.info("Text processing completed in %.0f ms", (time.monotonic() - started) * 1000)
+        return response_data
         
     except Exception as e:
         error_msg = f"Failed to process text: {str(e)}"
-        logger.error(f"❌ {error_msg}")
+        logger.error("❌ %s", error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
 
 @app.get("/conversation-history/{user_id}")
-async def get_conversation_history(user_id: str, session_id: str = None, limit: int = 50):
-    """Get conversation history for a user"""
+async def get_conversation_history(user_id: str, session_id: str = None, limit: int = 50,
+                                   cursor: str = None, cursor_id: str = None):
+    """
+    Get conversation history for a user; pass next_cursor and next_cursor_id back as
+    cursor and cursor_id for the next page
+    """
+    # Reject malformed cursors up front; they would otherwise surface as a 500 from the query
+    if cursor_id is not None and cursor is None:
+        raise HTTPException(status_code=400, detail="cursor_id requires cursor")
+    if cursor is not None:
+        try:
+            datetime.fromisoformat(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="cursor must be an ISO 8601 timestamp")
+    if cursor_id is not None:
+        try:
+            uuid.UUID(cursor_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="cursor_id must be a record id")
+    
     if not DATABASE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        history = conversation_service.get_conversation_history(user_id, session_id, limit)
-        return JSONResponse({
+        # Service calls are blocking (they also back gRPC and Streamlit), so keep them off the event loop
+        history = await asyncio.to_thread(
+            conversation_service.get_conversation_history, user_id, session_id, limit, cursor, cursor_id
+        )
+        # Turns flushed in one batch share a timestamp, so the id is part of the cursor
+        last = history[-1] if len(history) == limit else None
+        return {
             "user_id": user_id,
             "session_id": session_id,
             "conversation_count": len(history),
-            "conversations": history
-        })
+            "conversations": history,
+            "next_cursor": last["timestamp"] if last else None,
+            "next_cursor_id": last["id"] if last else None
+        }
     except Exception as e:
-        logger.error(f"Error getting conversation history: {e}")
+        logger.error("Error getting conversation history: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get conversation history: {str(e)}")
 
 @app.get("/session/{session_id}")
@@ -342,33 +666,19 @@ async def get_session(session_id: str):
         raise HTTPException(status_code=503, detail="Database not available")
     
     try:
-        session = session_service.get_user_session(session_id)
+        session = await asyncio.to_thread(session_service.get_user_session, session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
         
-        return JSONResponse(session)
+        return session
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error getting session: {e}")
+        logger.error("Error getting session: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get session: {str(e)}")
 
-@app.get("/health")
-async def health_check():
-    """Enhanced health check endpoint with comprehensive service status"""
-    # Check database status
-    db_status = "connected"
-    if DATABASE_AVAILABLE:
-        try:
-            from supabase_client import supabase_client
-            if not supabase_client.test_connection():
-                db_status = "connection_failed"
-        except Exception as e:
-            db_status = f"error: {str(e)}"
-    else:
-        db_status = "not_configured"
-    
-    # Check Google Cloud Services status
+def build_google_status():
+    """Summarize Google Cloud configuration; fixed once the clients are initialized"""
     google_status = "not_available"
     google_details = {}
     
@@ -380,35 +690,56 @@ async def health_check():
         except Exception as e:
             google_status = f"error: {str(e)}"
     
+    return google_status, google_details
+
+def build_health_services(google_status: str, google_details: dict) -> dict:
+    """Build the health entries that only depend on startup-time state"""
+    return {
+        "llm": {
+            "status": "available" if LLM_AVAILABLE else "not_available",
+            "available": LLM_AVAILABLE
+        },
+        "google_cloud": {
+            "status": google_status,
+            "available": GOOGLE_SERVICES_AVAILABLE,
+            "details": google_details
+        }
+    }
+
+def check_database_status() -> str:
+    """Ping the database; runs in a worker thread"""
+    if not DATABASE_AVAILABLE:
+        return "not_configured"
+    try:
+        from supabase_client import supabase_client
+        if not supabase_client.test_connection():
+            return "connection_failed"
+    except Exception as e:
+        return f"error: {str(e)}"
+    return "connected"
+
+@app.get("/health")
+async def health_check():
+    """Enhanced health check endpoint with comprehensive service status"""
+    db_status = await asyncio.to_thread(check_database_status)
+    
     # Overall health status
     overall_status = "healthy"
-    if db_status != "connected" or google_status != "configured":
+    if db_status != "connected" or not app.state.google_configured:
         overall_status = "degraded"
     
-    return JSONResponse({
+    return {
         "status": overall_status,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
         "services": {
-            "database": {
-                "status": db_status,
-                "available": DATABASE_AVAILABLE
-            },
-            "llm": {
-                "status": "available" if LLM_AVAILABLE else "not_available",
-                "available": LLM_AVAILABLE
-            },
-            "google_cloud": {
-                "status": google_status,
-                "available": GOOGLE_SERVICES_AVAILABLE,
-                "details": google_details
-            }
+            "database": {"status": db_status, "available": DATABASE_AVAILABLE},
+            **app.state.health_services
         },
         "version": "2.0.0"
-    })
+    }
 
-@app.get("/services/status")
-async def get_services_status():
-    """Get detailed status of all services"""
+def build_services_status():
+    """Build the services status payload; it only depends on startup-time state"""
     status = {
         "database": {
             "available": DATABASE_AVAILABLE,
@@ -428,53 +759,64 @@ async def get_services_status():
     if GOOGLE_SERVICES_AVAILABLE and google_services:
         status["google_cloud"]["details"] = google_services.get_service_status()
     
-    return JSONResponse(status)
+    return status
+
+@app.get("/services/status")
+async def get_services_status(request: Request):
+    """Get detailed status of all services"""
+    return static_json_response(request, app.state.services_status_json, app.state.services_status_json_br)
+
+def _test_database():
+    """Probe the database connection"""
+    from supabase_client import supabase_client
+    if supabase_client.test_connection():
+        return {"status": "working", "error": None}
+    return {"status": "failed", "error": "Connection failed"}
+
+def _test_llm():
+    """Probe the LLM with a short prompt"""
+    # Straight to the API: process_text would answer from the response cache and
+    # turns API errors into an apology string, so neither would show an outage
+    if get_llm_processor().ping():
+        return {"status": "working", "error": None}
+    return {"status": "failed", "error": "No response generated"}
+
+async def _run_probe(probe, timeout: float):
+    """Run a blocking probe in a thread, turning timeouts and errors into a failed result"""
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(probe), timeout)
+    except asyncio.TimeoutError:
+        return {"status": "failed", "error": f"Timed out after {timeout:g}s"}
+    except Exception as e:
+        return {"status": "failed", "error": str(e)}
 
 @app.get("/services/test")
 async def test_services():
     """Test all available services"""
-    test_results = {
-        "database": {"status": "not_tested", "error": None},
-        "llm": {"status": "not_tested", "error": None},
-        "google_cloud": {"status": "not_tested", "error": None}
+    # Monitoring polls this endpoint; results are reused for SERVICE_TEST_TTL seconds
+    test_results = service_test_cache.get("results")
+    if test_results is not None:
+        return test_results
+    
+    not_tested = {"status": "not_tested", "error": None}
+    probes = {
+        "database": (_test_database, 2.0) if DATABASE_AVAILABLE else None,
+        "llm": (_test_llm, 5.0) if LLM_AVAILABLE else None,
+        "google_cloud": (google_services.test_services, 5.0) if GOOGLE_SERVICES_AVAILABLE and google_services else None
     }
     
-    # Test database
-    if DATABASE_AVAILABLE:
-        try:
-            from supabase_client import supabase_client
-            if supabase_client.test_connection():
-                test_results["database"] = {"status": "working", "error": None}
-            else:
-                test_results["database"] = {"status": "failed", "error": "Connection failed"}
-        except Exception as e:
-            test_results["database"] = {"status": "failed", "error": str(e)}
+    # Probes run concurrently so a hung provider can't stall the others
+    names = [name for name, probe in probes.items() if probe]
+    results = await asyncio.gather(*(_run_probe(*probes[name]) for name in names))
     
-    # Test LLM
-    if LLM_AVAILABLE:
-        try:
-            test_response = llm_processor.process_text("Test message", "test_user", "test_session")
-            if test_response:
-                test_results["llm"] = {"status": "working", "error": None}
-            else:
-                test_results["llm"] = {"status": "failed", "error": "No response generated"}
-        except Exception as e:
-            test_results["llm"] = {"status": "failed", "error": str(e)}
-    
-    # Test Google Cloud Services
-    if GOOGLE_SERVICES_AVAILABLE and google_services:
-        try:
-            google_test_results = google_services.test_services()
-            test_results["google_cloud"] = google_test_results
-        except Exception as e:
-            test_results["google_cloud"] = {"status": "failed", "error": str(e)}
-    
-    return JSONResponse(test_results)
+    test_results = {name: dict(not_tested) for name in probes}
+    test_results.update(zip(names, results))
+    service_test_cache["results"] = test_results
+    return test_results
 
-@app.get("/")
-async def root():
-    """Enhanced root endpoint with comprehensive information"""
-    return JSONResponse({
+def build_root_info():
+    """Build the root endpoint payload; it only depends on startup-time flags"""
+    return {
         "message": "Voice Assistant API v2.0 - Enhanced with Google Cloud Speech Services",
         "version": "2.0.0",
         "endpoints": {
@@ -503,8 +845,36 @@ async def root():
             "Enhanced error handling",
             "Comprehensive status monitoring"
         ]
-    })
+    }
+
+def static_json_response(request: Request, body: bytes, body_br: bytes) -> Response:
+    """Serve a pre-serialized JSON body, Brotli-compressed when the client accepts it"""
+    if "br" in request.headers.get("accept-encoding", ""):
+        return Response(
+            content=body_br,
+            media_type="application/json",
+            headers={"Content-Encoding": "br", "Vary": "Accept-Encoding"}
+        )
+    return Response(content=body, media_type="application/json")
+
+@app.get("/")
+async def root(request: Request):
+    """Enhanced root endpoint with comprehensive information"""
+    return static_json_response(request, app.state.root_json, app.state.root_json_br)
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
+    # Each worker is its own process with its own module-level singletons.
+    # Any in-process cache is therefore per-worker; move shared caches to
+    # Redis once running with more than one worker.
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 8000)),
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        loop="uvloop",
+        ws_max_size=WS_MAX_MESSAGE_BYTES,
+        http="httptools",
+        log_level="warning",
+        access_log=False
+    )
 
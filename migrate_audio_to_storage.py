@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+One-off migration: move hex-encoded audio out of conversation_records into Supabase Storage
+Run after adding the audio_input_url/audio_response_url columns from supabase_schema.sql
+"""
+
+import binascii
+import sys
+
+from supabase_client import supabase_client
+from models import audio_storage_service
+
+BATCH_SIZE = 100
+
+def migrate_record(record: dict) -> dict:
+    """Upload a record's legacy hex audio and return the storage path columns"""
+    audio_format = record.get('audio_format') or 'wav'
+    update = {}
+    for column in ('audio_input', 'audio_response'):
+        hex_audio = record.get(column)
+        if not hex_audio:
+            continue
+        if record.get(f"{column}_url"):
+            # Already uploaded on an earlier run; just drop the hex payload
+            update[column] = None
+            continue
+        try:
+            # a2b_hex decodes the ASCII bytes in C without an intermediate str
+            audio = binascii.a2b_hex(hex_audio.encode('ascii'))
+        except (binascii.Error, ValueError, TypeError, UnicodeEncodeError):
+            continue
+        update[f"{column}_url"] = audio_storage_service.save_audio(record['session_id'], audio, audio_format)
+        # Clear the hex payload once it is safely in storage
+        update[column] = None
+    return update
+
+def main():
+    print("🚚 Migrating conversation audio to Supabase Storage...")
+    migrated = 0
+    skipped = 0
+    last_id = None
+
+    while True:
+        # Page by id so rows left behind (invalid hex) are never re-fetched
+        query = supabase_client.client.table('conversation_records')\
+            .select('id, session_id, audio_input, audio_response, audio_input_url, audio_response_url, audio_format')\
+            .or_('audio_input.not.is.null,audio_response.not.is.null')
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        result = query.order('id').limit(BATCH_SIZE).execute()
+
+        if not result.data:
+            break
+
+        for record in result.data:
+            last_id = record['id']
+            update = migrate_record(record)
+            if update:
+                supabase_client.client.table('conversation_records').update(update).eq('id', record['id']).execute()
+                migrated += 1
+            invalid = [column for column in ('audio_input', 'audio_response')
+                       if record.get(column) and column not in update]
+            if invalid:
+                skipped += 1
+                print(f"⚠️ Skipping {', '.join(invalid)} on record {record['id']}: audio is not valid hex")
+
+    print(f"✅ Migrated audio for {migrated} records")
+    if skipped:
+        print(f"❌ {skipped} records still hold legacy audio that could not be migrated")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -170,7 +170,8 @@ def run_basic_test():
         from google_services import google_services
         print("✅ Google services loaded")
         
-        from llm_processor import llm_processor
+        from llm_processor import get_llm_processor
+        get_llm_processor()
         print("✅ LLM processor loaded")
         
         print("✅ All components loaded successfully")
@@ -5,90 +5,136 @@ Provides step-by-step instructions for setting up the database schema in Supabas
 """
 
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, List, Set
+from env_config import load_env
+from supabase import Client
+
+load_env()
+
+REQUIRED_TABLES = ['user_sessions', 'conversation_records']
+
+# Built once and written in a single call
+SETUP_INSTRUCTIONS = f"""
+{"=" * 70}
+📋 SUPABASE DATABASE SCHEMA SETUP INSTRUCTIONS
+{"=" * 70}
+
+🔗 Step 1: Open Supabase Dashboard
+   1. Go to https://supabase.com/dashboard
+   2. Sign in to your account
+   3. Select your project: czqnzosfhqthjjblkmfh
+
+📝 Step 2: Open SQL Editor
+   1. Click on 'SQL Editor' in the left sidebar
+   2. Click 'New query' to create a new SQL query
+
+📋 Step 3: Execute Schema SQL
+   1. Copy the contents of 'supabase_schema.sql' file
+   2. Paste it into the SQL editor
+   3. Click 'Run' to execute the SQL
+
+✨ Step 4: Verify Setup
+   1. After running the SQL, you should see tables created
+   2. Run this script again to verify: python3 setup_supabase_schema.py
+   3. Or run the full verification: python3 setup_verification.py
+
+📁 The SQL file contains:
+   ✓ user_sessions table - stores user session data
+   ✓ conversation_records table - stores conversation history
+   ✓ RLS policies for security (with anonymous access for development)
+   ✓ Indexes for performance optimization
+
+{"=" * 70}
+"""
+
+# Tables seen to exist, mapped to a time.monotonic() expiry. Only hits are cached,
+# so a table created by a migration is picked up on the very next check
+TABLE_EXISTS_TTL = 300
+_table_exists_cache: Dict[str, float] = {}
+_table_exists_lock = threading.Lock()
+
+@lru_cache(maxsize=1)
+def get_supabase() -> Client:
+    """
+    Get the process-wide Supabase client. This is the same instance the
+    application's supabase_client wrapper holds, so scripts that import both
+    (setup_verification.py) share one HTTP session instead of building two
+    """
+    from supabase_client import supabase_client
+    return supabase_client.client
 
 def test_supabase_connection():
     """Test connection to Supabase"""
     
-    # Load environment variables
-    load_dotenv()
-    
-    # Get Supabase credentials
-    supabase_url = os.getenv("SUPABASE_URL")
-    supabase_key = os.getenv("SUPABASE_KEY")
-    
-    if not supabase_url or not supabase_key:
+    if not os.getenv("SUPABASE_URL") or not os.getenv("SUPABASE_KEY"):
         print("❌ Error: SUPABASE_URL and SUPABASE_KEY must be set in .env file")
         return False, None
     
     try:
-        # Create Supabase client
-        supabase: Client = create_client(supabase_url, supabase_key)
+        supabase = get_supabase()
         print("✅ Connected to Supabase successfully")
         return True, supabase
     except Exception as e:
         print(f"❌ Error connecting to Supabase: {e}")
         return False, None
 
-def check_tables_exist(supabase: Client):
+def batch_tables_exist(supabase: Client, names: List[str]) -> Set[str]:
+    """Return the subset of names that exist as tables, in one round trip where possible"""
+    now = time.monotonic()
+    with _table_exists_lock:
+        existing = {name for name in names if _table_exists_cache.get(name, 0) > now}
+    pending = [name for name in names if name not in existing]
+    if not pending:
+        return existing
+    
+    found = _query_tables_exist(supabase, pending)
+    expires = time.monotonic() + TABLE_EXISTS_TTL
+    with _table_exists_lock:
+        for name in found:
+            _table_exists_cache[name] = expires
+    return existing | found
+
+def _query_tables_exist(supabase: Client, names: List[str]) -> Set[str]:
+    try:
+        result = supabase.rpc('tables_exist', {'names': names}).execute()
+        # SETOF text comes back as a bare list of names
+        return {row if isinstance(row, str) else next(iter(row.values())) for row in result.data or []}
+    except Exception:
+        # tables_exist() is created by supabase_schema.sql; before it has been run,
+        # probe each table directly
+        existing = set()
+        for name in names:
+            try:
+                # HEAD request: the table must resolve, but no rows or body come back
+                supabase.table(name).select('*', head=True).limit(1).execute()
+                existing.add(name)
+            except Exception:
+                pass
+        return existing
+
+def check_tables_exist(supabase: Client, tables: List[str] = REQUIRED_TABLES):
     """Check if the required tables exist"""
-    tables_status = {}
+    existing = batch_tables_exist(supabase, tables)
     
-    # Test user_sessions table
-    try:
-        result = supabase.table('user_sessions').select('*').limit(1).execute()
-        tables_status['user_sessions'] = True
-        print("✅ user_sessions table exists")
-    except Exception as e:
-        tables_status['user_sessions'] = False
-        print("❌ user_sessions table does not exist")
+    tables_status = {}
+    for table in tables:
+        tables_status[table] = table in existing
+        if tables_status[table]:
+            print(f"✅ {table} table exists")
+        else:
+            print(f"❌ {table} table does not exist")
     
-    # Test conversation_records table  
-    try:
-        result = supabase.table('conversation_records').select('*').limit(1).execute()
-        tables_status['conversation_records'] = True
-        print("✅ conversation_records table exists")
-    except Exception as e:
-        tables_status['conversation_records'] = False
-        print("❌ conversation_records table does not exist")
-        
     return tables_status
 
 def show_setup_instructions():
     """Show detailed setup instructions"""
-    print("\n" + "="*70)
-    print("📋 SUPABASE DATABASE SCHEMA SETUP INSTRUCTIONS")
-    print("="*70)
-    
-    print("\n🔗 Step 1: Open Supabase Dashboard")
-    print("   1. Go to https://supabase.com/dashboard")
-    print("   2. Sign in to your account")
-    print("   3. Select your project: czqnzosfhqthjjblkmfh")
-    
-    print("\n📝 Step 2: Open SQL Editor")
-    print("   1. Click on 'SQL Editor' in the left sidebar")
-    print("   2. Click 'New query' to create a new SQL query")
-    
-    print("\n📋 Step 3: Execute Schema SQL")
-    print("   1. Copy the contents of 'supabase_schema.sql' file")
-    print("   2. Paste it into the SQL editor")
-    print("   3. Click 'Run' to execute the SQL")
-    
-    print("\n✨ Step 4: Verify Setup")
-    print("   1. After running the SQL, you should see tables created")
-    print("   2. Run this script again to verify: python3 setup_supabase_schema.py")
-    print("   3. Or run the full verification: python3 setup_verification.py")
-    
-    print("\n📁 The SQL file contains:")
-    print("   ✓ user_sessions table - stores user session data")
-    print("   ✓ conversation_records table - stores conversation history")
-    print("   ✓ RLS policies for security (with anonymous access for development)")
-    print("   ✓ Indexes for performance optimization")
-    
-    print("\n" + "="*70)
+    sys.stdout.write(SETUP_INSTRUCTIONS)
 
-def main():
+def main(tables: List[str] = REQUIRED_TABLES):
     print("🚀 Supabase Schema Setup Helper")
     print("=" * 50)
     
@@ -100,7 +146,7 @@ def main():
         return
     
     print("\n🔍 Checking if database tables exist...")
-    tables_status = check_tables_exist(supabase)
+    tables_status = check_tables_exist(supabase, tables)
     
     all_tables_exist = all(tables_status.values())
     
@@ -4,25 +4,49 @@ Comprehensive Setup Verification Script for Voice Assistant with Supabase
 This script verifies all components are properly configured and working.
 """
 
+import contextlib
+import io
 import os
 import sys
-import subprocess
-import importlib
+import importlib.metadata
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from operator import itemgetter
 from typing import Dict, List, Tuple, Optional
 
 class SetupVerifier:
     def __init__(self):
         self.results: List[Tuple[str, bool, str]] = []
         self.errors: List[str] = []
+        # Network checks run concurrently, so results and output are serialized
+        self.lock = threading.Lock()
         
     def log_result(self, test_name: str, success: bool, message: str = ""):
         """Log a test result"""
         status = "✅" if success else "❌"
-        self.results.append((test_name, success, message))
-        print(f"{status} {test_name}: {message}")
-        if not success:
-            self.errors.append(f"{test_name}: {message}")
+        with self.lock:
+            self.results.append((test_name, success, message))
+            print(f"{status} {test_name}: {message}")
+            if not success:
+                self.errors.append(f"{test_name}: {message}")
+    
+    def run_network_checks(self, max_workers: int = 4):
+        """Run the independent, round-trip-bound checks concurrently"""
+        checks = [
+            self.check_supabase_connection,
+            self.check_database_schema,
+            self.check_api_server,
+            self.test_basic_functionality,
+        ]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(check): check.__name__ for check in checks}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    self.log_result(futures[future], False, f"Error: {str(e)}")
     
     def check_python_version(self) -> bool:
         """Check Python version"""
@@ -36,26 +60,32 @@ class SetupVerifier:
     
     def check_dependencies(self) -> bool:
         """Check if all required packages are installed"""
-        required_packages = [
-            'fastapi', 'uvicorn', 'supabase', 'openai', 'python-dotenv',
-            'sqlalchemy', 'psycopg2', 'numpy', 'torch', 'grpc',
-            'google.cloud.speech', 'google.cloud.texttospeech'
-        ]
+        # Import name -> distribution names that provide it
+        required_packages = {
+            'fastapi': ('fastapi',),
+            'uvicorn': ('uvicorn',),
+            'supabase': ('supabase',),
+            'openai': ('openai',),
+            'python-dotenv': ('python-dotenv',),
+            'sqlalchemy': ('sqlalchemy',),
+            'psycopg2': ('psycopg2', 'psycopg2-binary'),
+            'numpy': ('numpy',),
+            'torch': ('torch',),
+            'grpc': ('grpcio',),
+            'google.cloud.speech': ('google-cloud-speech',),
+            'google.cloud.texttospeech': ('google-cloud-texttospeech',)
+        }
         
-        missing_packages = []
-        for package in required_packages:
-            try:
-                if '.' in package:
-                    # Handle nested imports like google.cloud.speech
-                    importlib.import_module(package)
-                else:
-                    # Handle special import names
-                    if package == 'python-dotenv':
-                        importlib.import_module('dotenv')
-                    else:
-                        importlib.import_module(package)
-            except ImportError:
-                missing_packages.append(package)
+        # Read the installed-distribution index rather than importing each package;
+        # torch and grpc alone take seconds to import
+        installed = {
+            re.sub(r'[-_.]+', '-', dist.metadata['Name']).lower()
+            for dist in importlib.metadata.distributions() if dist.metadata['Name']
+        }
+        missing_packages = [
+            package for package, dists in required_packages.items()
+            if not any(dist in installed for dist in dists)
+        ]
         
         if not missing_packages:
             self.log_result("Dependencies", True, "All required packages installed")
@@ -79,21 +109,24 @@ class SetupVerifier:
             'GOOGLE_APPLICATION_CREDENTIALS': 'Google Cloud credentials (required for speech services)'
         }
         
+        # Snapshot the variables of interest once, with display values pre-masked
+        env = {var: os.environ.get(var) for var in (*required_vars, *optional_vars)}
+        masked = {var: value[:20] + "..." if len(value) > 20 else value for var, value in env.items() if value}
+        
         all_good = True
         
         # Check required variables
         for var, description in required_vars.items():
-            value = os.getenv(var)
+            value = env[var]
             if value:
-                masked_value = value[:20] + "..." if len(value) > 20 else value
-                self.log_result(f"Env Var: {var}", True, f"Set ({masked_value})")
+                self.log_result(f"Env Var: {var}", True, f"Set ({masked[var]})")
             else:
                 self.log_result(f"Env Var: {var}", False, f"Not set - {description}")
                 all_good = False
         
         # Check optional variables
         for var, description in optional_vars.items():
-            value = os.getenv(var)
+            value = env[var]
             if value:
                 if var == 'GOOGLE_APPLICATION_CREDENTIALS':
                     if os.path.exists(value):
@@ -102,8 +135,7 @@ class SetupVerifier:
                         self.log_result(f"Env Var: {var}", False, f"File not found: {value}")
                         all_good = False
                 else:
-                    masked_value = value[:20] + "..." if len(value) > 20 else value
-                    self.log_result(f"Env Var: {var}", True, f"Set ({masked_value})")
+                    self.log_result(f"Env Var: {var}", True, f"Set ({masked[var]})")
             else:
                 if var == 'GOOGLE_APPLICATION_CREDENTIALS':
                     self.log_result(f"Env Var: {var}", True, f"Not set (optional for basic testing)")
@@ -129,17 +161,16 @@ class SetupVerifier:
     def check_database_schema(self) -> bool:
         """Check if database tables exist"""
         try:
-            from supabase_client import supabase_client
+            from setup_supabase_schema import get_supabase, batch_tables_exist
             
-            # Try to query each table
             tables_to_check = ['conversation_records', 'user_sessions']
+            existing = batch_tables_exist(get_supabase(), tables_to_check)
             
             for table in tables_to_check:
-                try:
-                    result = supabase_client.client.table(table).select("count", count="exact").limit(1).execute()
+                if table in existing:
                     self.log_result(f"Table: {table}", True, "Table exists and accessible")
-                except Exception as e:
-                    self.log_result(f"Table: {table}", False, f"Error accessing table: {str(e)}")
+                else:
+                    self.log_result(f"Table: {table}", False, "Table does not exist or is not accessible")
                     return False
             
             return True
@@ -155,9 +186,13 @@ class SetupVerifier:
             'requirements.txt', '.env', 'voice_assistant.proto'
         ]
         
+        # One directory listing instead of a stat per file
+        with os.scandir('.') as it:
+            entries = {entry.name for entry in it}
+        
         missing_files = []
         for file in required_files:
-            if os.path.exists(file):
+            if file in entries:
                 self.log_result(f"File: {file}", True, "Exists")
             else:
                 self.log_result(f"File: {file}", False, "Missing")
@@ -216,28 +251,43 @@ class SetupVerifier:
             self.log_result("FastAPI Import", False, f"Error: {str(e)}")
             return False
     
-    def run_comprehensive_test(self) -> bool:
+    def run_comprehensive_test(self, timeout: float = 30) -> bool:
         """Run the comprehensive test suite"""
-        try:
-            result = subprocess.run([sys.executable, 'test_supabase.py'], 
-                                  capture_output=True, text=True, timeout=30)
-            if result.returncode == 0:
-                self.log_result("Comprehensive Tests", True, "All tests passed")
-                return True
-            else:
-                self.log_result("Comprehensive Tests", False, f"Tests failed: {result.stderr}")
-                return False
-        except subprocess.TimeoutExpired:
+        # In-process, so the suite reuses the already imported packages and Supabase
+        # client instead of paying for a fresh interpreter. Its output is captured,
+        # which swaps sys.stdout globally, so this must not overlap other checks
+        output = io.StringIO()
+        outcome = {}
+        
+        def run():
+            try:
+                import test_supabase
+                outcome['passed'] = test_supabase.run_all()
+            except Exception as e:
+                outcome['error'] = e
+        
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            worker = threading.Thread(target=run, daemon=True)
+            worker.start()
+            worker.join(timeout)
+        
+        if worker.is_alive():
             self.log_result("Comprehensive Tests", False, "Tests timed out")
             return False
-        except Exception as e:
-            self.log_result("Comprehensive Tests", False, f"Error running tests: {str(e)}")
+        if 'error' in outcome:
+            self.log_result("Comprehensive Tests", False, f"Error running tests: {str(outcome['error'])}")
+            return False
+        if outcome.get('passed'):
+            self.log_result("Comprehensive Tests", True, "All tests passed")
+            return True
+        else:
+            self.log_result("Comprehensive Tests", False, f"Tests failed: {output.getvalue().strip()[-500:]}")
             return False
     
     def print_summary(self):
         """Print verification summary"""
         total_tests = len(self.results)
-        passed_tests = sum(1 for _, success, _ in self.results if success)
+        passed_tests = sum(map(itemgetter(1), self.results))
         failed_tests = total_tests - passed_tests
         
         print("\n" + "="*60)
@@ -288,18 +338,14 @@ def main():
     verifier.check_dependencies()
     verifier.check_environment_variables()
     verifier.check_project_files()
-    verifier.check_supabase_connection()
-    verifier.check_database_schema()
-    verifier.check_api_server()
-    verifier.test_basic_functionality()
+    verifier.run_network_checks()
     verifier.run_comprehensive_test()
     
     # Print summary
     verifier.print_summary()
     
     # Exit with appropriate code
-    failed_tests = sum(1 for _, success, _ in verifier.results if not success)
-    sys.exit(0 if failed_tests == 0 else 1)
+    sys.exit(0 if all(map(itemgetter(1), verifier.results)) else 1)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -7,16 +7,18 @@ Convenient launcher for different components
 import sys
 import os
 import subprocess
-import argparse
 from pathlib import Path
 
+def _exec_script(script: str):
+    """Replace this process with the given script, so signals go straight to it"""
+    sys.stdout.flush()
+    os.execv(sys.executable, [sys.executable, script])
+
 def start_grpc_server():
     """Start the gRPC server"""
     print("🚀 Starting gRPC Voice Assistant Server...")
     try:
-        subprocess.run([sys.executable, "grpc_server.py"])
-    except KeyboardInterrupt:
-        print("\n⚠️  gRPC server stopped by user")
+        _exec_script("grpc_server.py")
     except Exception as e:
         print(f"❌ Error starting gRPC server: {e}")
 
@@ -24,9 +26,7 @@ def start_fastapi_server():
     """Start the FastAPI server"""
     print("🚀 Starting FastAPI Server...")
     try:
-        subprocess.run([sys.executable, "main.py"])
-    except KeyboardInterrupt:
-        print("\n⚠️  FastAPI server stopped by user")
+        _exec_script("main.py")
     except Exception as e:
         print(f"❌ Error starting FastAPI server: {e}")
 
@@ -34,7 +34,7 @@ def run_client_demo():
     """Run the client demonstration"""
     print("🎤 Running Voice Assistant Client Demo...")
     try:
-        subprocess.run([sys.executable, "client_example.py"])
+        _exec_script("client_example.py")
     except Exception as e:
         print(f"❌ Error running client demo: {e}")
 
@@ -42,7 +42,7 @@ def run_setup():
     """Run the setup script"""
     print("⚙️  Running Voice Assistant Setup...")
     try:
-        subprocess.run([sys.executable, "setup.py"])
+        _exec_script("setup.py")
     except Exception as e:
         print(f"❌ Error running setup: {e}")
 
@@ -103,63 +103,52 @@ def show_status():
         print("\n🔐 Environment Variables:")
         print("  ❌ .env file not found")
 
-def main():
-    """Main function with argument parsing"""
-    parser = argparse.ArgumentParser(
-        description="Voice Assistant Start Script",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
+USAGE = """🎤 Voice Assistant System
+==============================
+
+Available commands:
+  --setup     Run initial setup
+  --grpc      Start gRPC server
+  --fastapi   Start FastAPI server
+  --demo      Run client demo
+  --generate  Generate gRPC code
+  --status    Show system status
+
 Examples:
   python start.py --grpc          Start gRPC server
   python start.py --fastapi       Start FastAPI server
   python start.py --demo          Run client demo
   python start.py --setup         Run setup process
   python start.py --status        Show system status
-        """
-    )
-    
-    parser.add_argument('--grpc', action='store_true', 
-                       help='Start the gRPC server')
-    parser.add_argument('--fastapi', action='store_true',
-                       help='Start the FastAPI server')
-    parser.add_argument('--demo', action='store_true',
-                       help='Run the client demonstration')
-    parser.add_argument('--setup', action='store_true',
-                       help='Run the setup process')
-    parser.add_argument('--generate', action='store_true',
-                       help='Generate gRPC code from protobuf')
-    parser.add_argument('--status', action='store_true',
-                       help='Show system status')
-    
-    args = parser.parse_args()
-    
-    # If no arguments provided, show help
-    if not any(vars(args).values()):
-        print("🎤 Voice Assistant System")
-        print("=" * 30)
-        print("\nAvailable commands:")
-        print("  --setup     Run initial setup")
-        print("  --grpc      Start gRPC server")
-        print("  --fastapi   Start FastAPI server")
-        print("  --demo      Run client demo")
-        print("  --generate  Generate gRPC code")
-        print("  --status    Show system status")
-        print("\nFor more details: python start.py --help")
+"""
+
+def show_help():
+    """Show available commands"""
+    print(USAGE)
+
+COMMANDS = {
+    '--setup': run_setup,
+    '--grpc': start_grpc_server,
+    '--fastapi': start_fastapi_server,
+    '--demo': run_client_demo,
+    '--generate': generate_grpc,
+    '--status': show_status,
+    '--help': show_help,
+    '-h': show_help,
+}
+
+def main():
+    """Dispatch the command-line flag to its launcher"""
+    if len(sys.argv) < 2:
+        show_help()
         return
     
-    # Execute based on arguments
-    if args.setup:
-        run_setup()
-    elif args.grpc:
-        start_grpc_server()
-    elif args.fastapi:
-        start_fastapi_server()
-    elif args.demo:
-        run_client_demo()
-    elif args.generate:
-        generate_grpc()
-    elif args.status:
-        show_status()
+    command = COMMANDS.get(sys.argv[1])
+    if command is None:
+        print(f"❌ Unknown command: {sys.argv[1]}\n")
+        show_help()
+        sys.exit(2)
+    command()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
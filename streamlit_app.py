@@ -1,12 +1,38 @@
 import streamlit as st
-import soundfile as sf
+import hashlib
 import io
-import json
-from datetime import datetime
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+import numpy as np
+import soundfile as sf
+
+# Streamlit re-executes this script on every interaction; cache_resource keeps one
+# instance of each service (gRPC channels, API clients) across reruns and sessions
+@st.cache_resource
+def load_google_services():
+    from google_services import google_services
+    if google_services:
+        # Open both gRPC channels now so the first interaction skips the TLS and
+        # HTTP/2 handshake; the cached instance keeps them warm for later reruns
+        try:
+            google_services.warmup()
+        except Exception as e:
+            print(f"⚠️ Google Cloud warmup failed: {e}")
+    return google_services
+
+@st.cache_resource
+def load_llm_processor():
+    from llm_processor import get_llm_processor
+    return get_llm_processor()
 
 # Import services with error handling
 try:
-    from google_services import google_services
+    google_services = load_google_services()
     GOOGLE_SERVICES_AVAILABLE = True
 except Exception as e:
     st.error(f"❌ Failed to load Google Cloud Services: {e}")
@@ -14,23 +40,147 @@ except Exception as e:
     google_services = None
 
 try:
-    from llm_processor import llm_processor
+    llm_processor = load_llm_processor()
     LLM_AVAILABLE = True
 except Exception as e:
     st.error(f"❌ Failed to load LLM processor: {e}")
     LLM_AVAILABLE = False
     llm_processor = None
 
-# Page configuration
-st.set_page_config(
-    page_title="Voice Assistant", 
-    page_icon="🗣️",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+@st.cache_resource
+def get_tts_executor():
+    """
+    Worker threads for speech synthesis, shared across reruns and sessions; the
+    pool size also caps in-flight TTS calls for the whole process
+    """
+    return ThreadPoolExecutor(max_workers=4)
 
-# Custom CSS for better styling
-st.markdown("""
+@st.cache_resource
+def get_stt_semaphore():
+    """Process-wide cap on concurrent speech-to-text calls, to stay within quota"""
+    return threading.BoundedSemaphore(4)
+
+@st.cache_resource
+def get_transcript_cache():
+    """Transcripts by audio digest, shared across reruns and sessions"""
+    return TTLCache(maxsize=256, ttl=3600), threading.Lock()
+
+HISTORY_MAX_MESSAGES = 200
+STT_CHUNK_SIZE = 16 * 1024  # Streaming recognition accepts at most 25KB per request
+STT_SAMPLE_RATE = 16000  # Matches the LINEAR16 recognition config in google_services
+# Replies are only played in the browser, so synthesize compressed audio (~5x smaller than WAV)
+TTS_ENCODING = "MP3"
+# Speech languages offered in the sidebar; the first is the default
+LANGUAGES = ["en-US", "en-IN", "en-GB", "hi-IN", "es-ES", "fr-FR", "de-DE"]
+
+def to_linear16(audio_data):
+    """
+    Decode an uploaded or recorded clip to the raw 16kHz mono PCM16 the recognizer
+    is configured for, so WAV/MP3 input at other rates or channel counts is not
+    misread. Formats soundfile cannot decode (e.g. m4a) are passed through unchanged.
+    """
+    try:
+        with sf.SoundFile(io.BytesIO(audio_data)) as clip:
+            if clip.samplerate == STT_SAMPLE_RATE and clip.channels == 1:
+                # Already in the target format: read the samples straight out as PCM16
+                return clip.read(dtype="int16").tobytes()
+            samples, sample_rate = clip.read(dtype="float32", always_2d=True), clip.samplerate
+    except RuntimeError:  # LibsndfileError: unsupported or corrupt input
+        return audio_data
+    
+    return pcm16_mono(samples[:, 0] if samples.shape[1] == 1 else samples.mean(axis=1), sample_rate)
+
+def pcm16_mono(samples, sample_rate):
+    """
+    Resample mono float samples in [-1, 1] to 16kHz and encode them as raw PCM16.
+    Scaling happens in place, so callers must not reuse samples afterwards.
+    """
+    if sample_rate != STT_SAMPLE_RATE and len(samples):
+        target_length = int(round(len(samples) * STT_SAMPLE_RATE / sample_rate))
+        samples = np.interp(
+            np.arange(target_length) * (sample_rate / STT_SAMPLE_RATE),
+            np.arange(len(samples)),
+            samples
+        )
+    np.clip(samples, -1.0, 1.0, out=samples)
+    samples *= 32767
+    return samples.astype("<i2").tobytes()
+
+class LiveTranscriber:
+    """
+    Feeds microphone frames from streamlit-webrtc into streaming recognition while
+    the user is still speaking, so only the tail is left to transcribe on stop
+    """
+    
+    def __init__(self, language_code):
+        self.language_code = language_code
+        self.frames = queue.Queue()
+        self.interim = ""
+        self.result = None
+        self._thread = None
+    
+    @property
+    def started(self):
+        return self._thread is not None
+    
+    def on_frame(self, frame):
+        """audio_frame_callback; runs on the WebRTC worker thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        # Packed s16 frames arrive as one interleaved row
+        channels = len(frame.layout.channels)
+        samples = frame.to_ndarray().reshape(-1, channels).mean(axis=1) / 32768
+        self.frames.put(pcm16_mono(samples, frame.sample_rate))
+        return frame
+    
+    def _set_interim(self, text):
+        self.interim = text
+    
+    def _run(self):
+        def chunks():
+            while (chunk := self.frames.get()) is not None:
+                yield chunk
+        try:
+            with get_stt_semaphore():
+                self.result = google_services.transcribe_stream(
+                    chunks(), on_interim=self._set_interim, language_code=self.language_code
+                )
+        except Exception as e:
+            self.result = (None, {"error": f"Live transcription failed: {e}"})
+    
+    def finish(self, timeout=30):
+        """End the audio stream and wait for the final transcript"""
+        self.frames.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return None, {"error": "Live transcription did not finish in time"}
+        return self.result
+
+def speech_to_text(audio_data, language_code, on_interim=None):
+    """
+    Transcribe audio by streaming it to Google in chunks, reporting partial
+    transcripts through on_interim. Re-submitting the same audio within an hour
+    reuses the earlier transcript; failures are not cached.
+    """
+    cache, lock = get_transcript_cache()
+    digest = (language_code, hashlib.sha256(audio_data).digest())
+    with lock:
+        cached = cache.get(digest)
+    if cached is not None:
+        return cached
+    
+    view = memoryview(to_linear16(audio_data))
+    chunks = (bytes(view[i:i + STT_CHUNK_SIZE]) for i in range(0, len(view), STT_CHUNK_SIZE))
+    with get_stt_semaphore():
+        transcript, metadata = google_services.transcribe_stream(chunks, on_interim=on_interim, language_code=language_code)
+    if transcript:
+        with lock:
+            cache[digest] = (transcript, metadata)
+    return transcript, metadata
+
+# Static page chrome; only the header style is used, the card classes were never referenced
+PAGE_HEADER_HTML = """
 <style>
     .main-header {
         background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
@@ -40,44 +190,23 @@ st.markdown("""
         text-align: center;
         margin-bottom: 2rem;
     }
-    .status-card {
-        background: #f0f2f6;
-        padding: 1rem;
-        border-radius: 8px;
-        border-left: 4px solid #667eea;
-        margin: 1rem 0;
-    }
-    .error-card {
-        background: #ffe6e6;
-        padding: 1rem;
-        border-radius: 8px;
-        border-left: 4px solid #ff4444;
-        margin: 1rem 0;
-    }
-    .success-card {
-        background: #e6ffe6;
-        padding: 1rem;
-        border-radius: 8px;
-        border-left: 4px solid #44ff44;
-        margin: 1rem 0;
-    }
-    .info-card {
-        background: #e6f3ff;
-        padding: 1rem;
-        border-radius: 8px;
-        border-left: 4px solid #4488ff;
-        margin: 1rem 0;
-    }
 </style>
-""", unsafe_allow_html=True)
-
-# Main header
-st.markdown("""
 <div class="main-header">
     <h1>🗣️ Voice Assistant</h1>
     <p>Powered by Google Cloud Speech & OpenAI</p>
 </div>
-""", unsafe_allow_html=True)
+"""
+
+# Page configuration
+st.set_page_config(
+    page_title="Voice Assistant", 
+    page_icon="🗣️",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Custom CSS and main header, sent as one element on every rerun
+st.markdown(PAGE_HEADER_HTML, unsafe_allow_html=True)
 
 # Sidebar for status and configuration
 with st.sidebar:
@@ -129,6 +258,9 @@ with st.sidebar:
         st.error("❌ LLM Processor")
         st.error("Not available")
     
+    # Speech language, passed explicitly to recognition and synthesis
+    st.selectbox("🌐 Language", LANGUAGES, key="lang")
+    
     # Test Services Button
     if st.button("🧪 Test Services"):
         if GOOGLE_SERVICES_AVAILABLE and google_services:
@@ -140,7 +272,12 @@ with st.sidebar:
 
 # Session state initialization
 if "history" not in st.session_state:
-    st.session_state["history"] = []
+    # Bounded so long sessions don't grow memory or render time without limit
+    st.session_state["history"] = deque(maxlen=HISTORY_MAX_MESSAGES)
+
+if "llm_session_id" not in st.session_state:
+    # Stable per browser session so LLM requests from one visitor share an identity
+    st.session_state["llm_session_id"] = uuid.uuid4().hex
 
 if "processing_status" not in st.session_state:
     st.session_state["processing_status"] = "idle"
@@ -171,6 +308,37 @@ with col1:
     except ImportError:
         st.info("💡 Install 'streamlit-audio-recorder' for direct recording: `pip install streamlit-audio-recorder`")
         recorded_audio = None
+    
+    # Live microphone: transcription runs while recording, so stopping leaves only the tail
+    live_result = None
+    try:
+        from streamlit_webrtc import WebRtcMode, webrtc_streamer
+        LIVE_MIC_AVAILABLE = True
+    except ImportError:
+        LIVE_MIC_AVAILABLE = False
+    
+    if LIVE_MIC_AVAILABLE and GOOGLE_SERVICES_AVAILABLE and google_services:
+        if "live_transcriber" not in st.session_state:
+            st.session_state["live_transcriber"] = LiveTranscriber(st.session_state["lang"])
+        transcriber = st.session_state["live_transcriber"]
+        
+        st.write("Or speak live:")
+        ctx = webrtc_streamer(
+            key="live-mic",
+            mode=WebRtcMode.SENDONLY,
+            media_stream_constraints={"audio": True, "video": False},
+            audio_frame_callback=transcriber.on_frame
+        )
+        if ctx.state.playing:
+            # Stopping the stream reruns the script, which ends this loop
+            partial = st.empty()
+            while ctx.state.playing:
+                partial.write(f"⏳ {transcriber.interim}")
+                time.sleep(0.3)
+        elif transcriber.started:
+            live_result = transcriber.finish()
+            # A fresh transcriber for the next take
+            del st.session_state["live_transcriber"]
 
 with col2:
     st.header("💬 Text Input")
@@ -191,14 +359,16 @@ with col2:
 
 with col3:
     if st.button("🗑️ Clear History", use_container_width=True):
-        st.session_state["history"] = []
+        st.session_state["history"].clear()
         st.rerun()
 
 # Helper function to play audio
-def play_audio(audio_bytes, format="audio/wav"):
-    """Enhanced audio playback with error handling"""
+def play_audio(audio_bytes, format=None, autoplay=False):
+    """Enhanced audio playback with error handling; the format is sniffed if not given"""
+    if format is None:
+        format = "audio/wav" if audio_bytes[:4] == b"RIFF" else "audio/mpeg"
     try:
-        st.audio(audio_bytes, format=format)
+        st.audio(audio_bytes, format=format, autoplay=autoplay)
         return True
     except Exception as e:
         st.error(f"❌ Audio playback error: {e}")
@@ -216,13 +386,57 @@ def show_processing_status(status, message):
     elif status == "warning":
         st.warning(f"⚠️ {message}")
 
+def generate_reply(prompt, speak):
+    """
+    Stream the LLM reply onto the page, handing each finished sentence to TTS
+    while the next one is still being generated. Each sentence's audio is played
+    as soon as it and the ones before it are ready, so playback starts after the
+    first sentence rather than the whole reply.
+    Returns (response, audio, tts_metadata); audio is None if synthesis failed or was skipped.
+    """
+    placeholder = st.empty()
+    players = st.container()
+    sentences, futures, results = [], [], []
+    
+    def play_ready(wait=False):
+        # Clips are played strictly in order; stop at the first unfinished one
+        while len(results) < len(futures) and (wait or futures[len(results)].done()):
+            audio, tts_metadata = futures[len(results)].result()
+            results.append((audio, tts_metadata))
+            if audio:
+                with players:
+                    play_audio(audio, autoplay=len(results) == 1)
+    
+    for sentence in llm_processor.stream_sentences(prompt, "streamlit_user", st.session_state["llm_session_id"]):
+        sentences.append(sentence)
+        placeholder.write(f"💬 **Assistant:** {' '.join(sentences)}")
+        if speak:
+            futures.append(get_tts_executor().submit(google_services.text_to_speech, sentence, None, st.session_state["lang"], TTS_ENCODING))
+            play_ready()
+    
+    response = " ".join(sentences)
+    if not futures:
+        return response, None, {}
+    
+    play_ready(wait=True)
+    for audio, tts_metadata in results:
+        if not audio:
+            return response, None, tts_metadata
+    # MP3 is a sequence of self-contained frames, so per-sentence clips concatenate as-is
+    audio_response = b"".join(audio for audio, _ in results)
+    return response, audio_response, {**results[-1][1], "audio_size_bytes": len(audio_response)}
+
 # Process audio input
-if submit_audio:
+if submit_audio or live_result:
     audio_data = None
     
     # Determine audio source
-    if audio_file is not None:
-        audio_data = audio_file.read()
+    if live_result:
+        source_name = "live microphone"
+    elif audio_file is not None:
+        # getvalue() hands back the upload buffer itself instead of reading a copy,
+        # and is unaffected by the stream position on reruns
+        audio_data = audio_file.getvalue()
         source_name = f"uploaded file: {audio_file.name}"
     elif recorded_audio is not None:
         audio_data = recorded_audio
@@ -231,7 +445,7 @@ if submit_audio:
         st.error("❌ Please upload an audio file or record audio")
         st.stop()
     
-    if audio_data:
+    if audio_data or live_result:
         st.session_state["processing_status"] = "processing"
         
         # Display processing status
@@ -239,39 +453,39 @@ if submit_audio:
             st.write("🎤 Transcribing audio...")
             
             if GOOGLE_SERVICES_AVAILABLE and google_services:
-                transcript, metadata = google_services.speech_to_text(audio_data)
+                if live_result:
+                    # Already transcribed while the user was speaking
+                    transcript, metadata = live_result
+                else:
+                    partial = st.empty()
+                    transcript, metadata = speech_to_text(audio_data, st.session_state["lang"], on_interim=lambda text: partial.write(f"⏳ {text}"))
+                    partial.empty()
                 
                 if transcript:
-                    st.write(f"✅ Transcription successful (confidence: {metadata.get('confidence', 'N/A'):.2f})")
+                    confidence = metadata.get('confidence')
+                    confidence_str = f"{confidence:.2f}" if confidence is not None else "N/A"
+                    st.write(f"✅ Transcription successful (confidence: {confidence_str})")
                     st.write(f"📝 **Transcript:** {transcript}")
                     
                     # Add to history
-                    st.session_state["history"].append(("user", transcript, metadata))
+                    st.session_state["history"].append({"role": "user", "message": transcript, "metadata": metadata})
                     
                     # Process with LLM
                     st.write("🤖 Generating response...")
                     if LLM_AVAILABLE:
-                        response = llm_processor.process_text(transcript, "streamlit_user", "streamlit_session")
+                        response, audio_response, tts_metadata = generate_reply(transcript, speak=True)
                         if response:
                             st.write(f"✅ Response generated")
-                            st.write(f"💬 **Assistant:** {response}")
                             
                             # Add to history
-                            st.session_state["history"].append(("assistant", response, {}))
-                            
-                            # Generate audio response
-                            st.write("🔊 Synthesizing speech...")
-                            audio_response, tts_metadata = google_services.text_to_speech(response)
+                            st.session_state["history"].append({"role": "assistant", "message": response, "metadata": {}})
                             
                             if audio_response:
                                 st.write("✅ Audio synthesis successful")
-                                play_audio(audio_response)
                                 
                                 # Add audio metadata to history
                                 if st.session_state["history"]:
-                                    st.session_state["history"][-1] = (st.session_state["history"][-1][0], 
-                                                                     st.session_state["history"][-1][1], 
-                                                                     tts_metadata)
+                                    st.session_state["history"][-1]["metadata"] = tts_metadata
                             else:
                                 st.error("❌ Failed to synthesize response audio")
                                 if "error" in tts_metadata:
@@ -302,33 +516,26 @@ if submit_text and user_text.strip():
         st.write("💬 Processing text input...")
         
         # Add to history
-        st.session_state["history"].append(("user", user_text, {}))
+        st.session_state["history"].append({"role": "user", "message": user_text, "metadata": {}})
         
         # Process with LLM
         st.write("🤖 Generating response...")
         if LLM_AVAILABLE:
-            response = llm_processor.process_text(user_text, "streamlit_user", "streamlit_session")
+            speak = bool(GOOGLE_SERVICES_AVAILABLE and google_services)
+            response, audio_response, tts_metadata = generate_reply(user_text, speak)
             if response:
                 st.write(f"✅ Response generated")
-                st.write(f"💬 **Assistant:** {response}")
                 
                 # Add to history
-                st.session_state["history"].append(("assistant", response, {}))
+                st.session_state["history"].append({"role": "assistant", "message": response, "metadata": {}})
                 
-                # Generate audio response
-                st.write("🔊 Synthesizing speech...")
-                if GOOGLE_SERVICES_AVAILABLE and google_services:
-                    audio_response, tts_metadata = google_services.text_to_speech(response)
-                    
+                if speak:
                     if audio_response:
                         st.write("✅ Audio synthesis successful")
-                        play_audio(audio_response)
                         
                         # Add audio metadata to history
                         if st.session_state["history"]:
-                            st.session_state["history"][-1] = (st.session_state["history"][-1][0], 
-                                                             st.session_state["history"][-1][1], 
-                                                             tts_metadata)
+                            st.session_state["history"][-1]["metadata"] = tts_metadata
                     else:
                         st.error("❌ Failed to synthesize response audio")
                         if "error" in tts_metadata:
@@ -342,23 +549,33 @@ if submit_text and user_text.strip():
         
         status.update(label="Processing complete!", state="complete")
 
+def render_turn(entry):
+    """
+    Markdown for one history entry. Entries are complete by the time the history is
+    drawn, so the text is built once and kept on the entry for later reruns.
+    """
+    rendered = entry.get("markdown")
+    if rendered is None:
+        metadata = entry["metadata"]
+        if entry["role"] == "user":
+            lines = [f"🧑 **You:** {entry['message']}"]
+            if metadata.get("confidence") is not None:
+                lines.append(f"*Confidence: {metadata['confidence']:.2f}*")
+        else:
+            lines = [f"🤖 **Assistant:** {entry['message']}"]
+            if "audio_size_bytes" in metadata:
+                lines.append(f"*Audio: {metadata['audio_size_bytes']} bytes*")
+        rendered = entry["markdown"] = "\n\n".join(lines)
+    return rendered
+
 # Display conversation history
 st.header("📝 Conversation History")
 
 if not st.session_state["history"]:
     st.info("💡 Start a conversation by uploading audio or typing a message!")
 else:
-    for i, (role, message, metadata) in enumerate(st.session_state["history"]):
-        if role == "user":
-            with st.chat_message("user"):
-                st.write(message)
-                if metadata and "confidence" in metadata:
-                    st.caption(f"Confidence: {metadata['confidence']:.2f}")
-        else:
-            with st.chat_message("assistant"):
-                st.write(message)
-                if metadata and "audio_size_bytes" in metadata:
-                    st.caption(f"Audio: {metadata['audio_size_bytes']} bytes")
+    # One markdown element for the whole history instead of a chat element per message
+    st.markdown("\n\n".join(render_turn(entry) for entry in st.session_state["history"]))
 
 # Footer with additional information
 st.markdown("---")
@@ -1,15 +1,42 @@
 from supabase import create_client, Client
+import logging
 import os
-from dotenv import load_dotenv
-from typing import Optional, Dict, Any, List
+import threading
+from functools import lru_cache
+from env_config import load_env
+from typing import Optional, Dict, Any, List, Tuple
+import orjson
 
-load_dotenv()
+load_env()
+
+logger = logging.getLogger(__name__)
+
+# Explicit column list so reads never pull the legacy hex audio columns
+# still present on tables that haven't finished migrate_audio_to_storage.py
+CONVERSATION_COLUMNS = (
+    "id, user_id, session_id, audio_input_url, text_input, text_response, "
+    "audio_response_url, timestamp, sample_rate, audio_format"
+)
+# History lists only need the small metadata columns; audio is fetched per record
+CONVERSATION_HISTORY_COLUMNS = (
+    "id, user_id, session_id, text_input, text_response, timestamp, sample_rate, audio_format"
+)
+
+SESSION_COLUMNS = "session_id, user_id, created_at, last_activity, is_active"
+
+# Rows per bulk insert request, keeping large batches under PostgREST's body size limit
+INSERT_CHUNK_SIZE = 500
 
 class SupabaseClient:
     """
     Supabase client wrapper for the voice assistant application
     """
     
+    # Underlying clients by (url, key), so every wrapper in the process shares one
+    # HTTP session and connection pool
+    _client_cache: Dict[Tuple[str, str], Client] = {}
+    _client_cache_lock = threading.Lock()
+    
     def __init__(self):
         self.url = os.getenv('SUPABASE_URL')
         self.key = os.getenv('SUPABASE_KEY')
@@ -17,12 +44,40 @@ class SupabaseClient:
         if not self.url or not self.key:
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
         
-        self.client: Client = create_client(self.url, self.key)
+        with self._client_cache_lock:
+            client = self._client_cache.get((self.url, self.key))
+            if client is None:
+                client = self._client_cache[(self.url, self.key)] = create_client(self.url, self.key)
+        self.client: Client = client
+        self.audio_bucket = os.getenv('SUPABASE_AUDIO_BUCKET', 'audio')
     
     def get_client(self) -> Client:
         """Get the Supabase client instance"""
         return self.client
     
+    def _insert_rows(self, table: str, rows: List[Dict[str, Any]]):
+        """
+        Bulk insert through the PostgREST session with an orjson-encoded body.
+        Asks for return=minimal, so the inserted rows are not echoed back.
+        Large batches are sent INSERT_CHUNK_SIZE rows per request.
+        """
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            response = self.client.postgrest.session.post(
+                f"/{table}",
+                content=orjson.dumps(rows[start:start + INSERT_CHUNK_SIZE]),
+                headers={"Content-Type": "application/json", "Prefer": "return=minimal"}
+            )
+            response.raise_for_status()
+    
+    def _select_rows(self, table: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Read rows through the PostgREST session, decoding the body with orjson.
+        params use PostgREST query syntax, e.g. {'user_id': 'eq.abc', 'order': 'timestamp.desc'}.
+        """
+        response = self.client.postgrest.session.get(f"/{table}", params=params)
+        response.raise_for_status()
+        return orjson.loads(response.content)
+    
     # Conversation Records Operations
     def create_conversation_record(self, record_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new conversation record"""
@@ -30,30 +85,54 @@ class SupabaseClient:
             result = self.client.table('conversation_records').insert(record_data).execute()
             return result.data[0] if result.data else None
         except Exception as e:
-            print(f"Error creating conversation record: {e}")
+            logger.error("Error creating conversation record: %s", e)
+            raise
+    
+    def create_conversation_records(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Create several conversation records with a single bulk insert"""
+        try:
+            self._insert_rows('conversation_records', records)
+            return records
+        except Exception as e:
+            logger.error("Error creating conversation records: %s", e)
             raise
     
     def get_conversation_record(self, record_id: str) -> Optional[Dict[str, Any]]:
         """Get a conversation record by ID"""
         try:
-            result = self.client.table('conversation_records').select("*").eq('id', record_id).execute()
-            return result.data[0] if result.data else None
+            # maybe_single() asks PostgREST for a bare object; no result means no row
+            result = self.client.table('conversation_records').select(CONVERSATION_COLUMNS).eq('id', record_id).maybe_single().execute()
+            return result.data if result else None
         except Exception as e:
-            print(f"Error getting conversation record: {e}")
+            logger.error("Error getting conversation record: %s", e)
             return None
     
-    def get_conversation_history(self, user_id: str, session_id: str = None, limit: int = 50) -> List[Dict[str, Any]]:
-        """Get conversation history for a user, optionally filtered by session"""
+    def get_conversation_history(self, user_id: str, session_id: str = None, limit: int = 50,
+                                 before: Optional[str] = None,
+                                 before_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get conversation history for a user, optionally filtered by session and paged
+        by the (timestamp, id) keyset of the previous page's last record
+        """
         try:
-            query = self.client.table('conversation_records').select("*").eq('user_id', user_id)
-            
+            # History pages are the largest reads, so they skip the SDK's stdlib json decode
+            params = {
+                'select': CONVERSATION_HISTORY_COLUMNS.replace(' ', ''),
+                'user_id': f'eq.{user_id}',
+                'order': 'timestamp.desc,id.desc',
+                'limit': limit
+            }
             if session_id:
-                query = query.eq('session_id', session_id)
+                params['session_id'] = f'eq.{session_id}'
+            if before and before_id:
+                # Quoted because ISO timestamps contain PostgREST's reserved '.' and ':'
+                params['or'] = f'(timestamp.lt."{before}",and(timestamp.eq."{before}",id.lt."{before_id}"))'
+            elif before:
+                params['timestamp'] = f'lt.{before}'
             
-            result = query.order('timestamp', desc=True).limit(limit).execute()
-            return result.data or []
+            return self._select_rows('conversation_records', params)
         except Exception as e:
-            print(f"Error getting conversation history: {e}")
+            logger.error("Error getting conversation history: %s", e)
             return []
     
     def update_conversation_record(self, record_id: str, updates: Dict[str, Any]) -> Optional[Dict[str, Any]]:
@@ -62,7 +141,7 @@ class SupabaseClient:
             result = self.client.table('conversation_records').update(updates).eq('id', record_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
-            print(f"Error updating conversation record: {e}")
+            logger.error("Error updating conversation record: %s", e)
             return None
     
     def delete_conversation_record(self, record_id: str) -> bool:
@@ -71,35 +150,44 @@ class SupabaseClient:
             self.client.table('conversation_records').delete().eq('id', record_id).execute()
             return True
         except Exception as e:
-            print(f"Error deleting conversation record: {e}")
+            logger.error("Error deleting conversation record: %s", e)
             return False
     
     # User Sessions Operations
     def create_user_session(self, session_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Create a new user session"""
+        """Create a user session, or refresh the supplied columns if it already exists"""
         try:
-            result = self.client.table('user_sessions').insert(session_data).execute()
+            result = self.client.table('user_sessions').upsert(session_data, on_conflict='session_id').execute()
             return result.data[0] if result.data else None
         except Exception as e:
-            print(f"Error creating user session: {e}")
+            logger.error("Error creating user session: %s", e)
+            raise
+    
+    def create_user_sessions(self, sessions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Create several user sessions with a single bulk insert"""
+        try:
+            self._insert_rows('user_sessions', sessions)
+            return sessions
+        except Exception as e:
+            logger.error("Error creating user sessions: %s", e)
             raise
     
     def get_user_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Get a user session by ID"""
         try:
-            result = self.client.table('user_sessions').select("*").eq('session_id', session_id).execute()
-            return result.data[0] if result.data else None
+            result = self.client.table('user_sessions').select(SESSION_COLUMNS).eq('session_id', session_id).maybe_single().execute()
+            return result.data if result else None
         except Exception as e:
-            print(f"Error getting user session: {e}")
+            logger.error("Error getting user session: %s", e)
             return None
     
     def get_active_sessions(self, user_id: str) -> List[Dict[str, Any]]:
         """Get active sessions for a user"""
         try:
-            result = self.client.table('user_sessions').select("*").eq('user_id', user_id).eq('is_active', True).execute()
+            result = self.client.table('user_sessions').select(SESSION_COLUMNS).eq('user_id', user_id).eq('is_active', True).execute()
             return result.data or []
         except Exception as e:
-            print(f"Error getting active sessions: {e}")
+            logger.error("Error getting active sessions: %s", e)
             return []
     
     def update_session_activity(self, session_id: str) -> Optional[Dict[str, Any]]:
@@ -111,28 +199,68 @@ class SupabaseClient:
             }).eq('session_id', session_id).execute()
             return result.data[0] if result.data else None
         except Exception as e:
-            print(f"Error updating session activity: {e}")
+            logger.error("Error updating session activity: %s", e)
             return None
     
+    def update_sessions_activity(self, session_ids: List[str]) -> bool:
+        """Update the last activity timestamp for several sessions at once"""
+        try:
+            from datetime import datetime
+            self.client.table('user_sessions').update({
+                'last_activity': datetime.utcnow().isoformat()
+            }).in_('session_id', session_ids).execute()
+            return True
+        except Exception as e:
+            logger.error("Error updating sessions activity: %s", e)
+            return False
+    
     def deactivate_session(self, session_id: str) -> bool:
         """Deactivate a user session"""
         try:
             self.client.table('user_sessions').update({'is_active': False}).eq('session_id', session_id).execute()
             return True
         except Exception as e:
-            print(f"Error deactivating session: {e}")
+            logger.error("Error deactivating session: %s", e)
             return False
     
+    # Audio Storage Operations
+    def upload_audio(self, path: str, audio: bytes, content_type: str = 'audio/wav') -> str:
+        """Upload an audio blob to Supabase Storage and return its object path"""
+        try:
+            self.client.storage.from_(self.audio_bucket).upload(path, audio, {"content-type": content_type})
+            return path
+        except Exception as e:
+            logger.error("Error uploading audio: %s", e)
+            raise
+    
+    def create_signed_audio_url(self, path: str, expires_in: int = 3600) -> Optional[str]:
+        """Create a pre-signed playback URL for a stored audio blob"""
+        try:
+            result = self.client.storage.from_(self.audio_bucket).create_signed_url(path, expires_in)
+            return result.get('signedURL') or result.get('signedUrl')
+        except Exception as e:
+            logger.error("Error creating signed audio URL: %s", e)
+            return None
+    
     # Utility methods
     def test_connection(self) -> bool:
-        """Test the Supabase connection"""
+        """Test the Supabase connection with a live round trip on every call"""
         try:
-            # Try to query the user_sessions table
-            result = self.client.table('user_sessions').select("count", count="exact").limit(1).execute()
+            # HEAD request against user_sessions: proves the table resolves without an
+            # exact count, which would scan the whole table
+            self.client.table('user_sessions').select('session_id', head=True).limit(1).execute()
             return True
         except Exception as e:
-            print(f"Connection test failed: {e}")
+            logger.error("Connection test failed: %s", e)
             return False
 
-# Global instance
-supabase_client = SupabaseClient()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_supabase_client() -> SupabaseClient:
+    """Get the process-wide SupabaseClient, creating it on first use"""
+    return SupabaseClient()
+
+def __getattr__(name):
+    # `from supabase_client import supabase_client` resolves to the shared instance
+    if name == 'supabase_client':
+        return get_supabase_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
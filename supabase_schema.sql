@@ -6,15 +6,26 @@ CREATE TABLE IF NOT EXISTS conversation_records (
     id TEXT PRIMARY KEY,
     user_id TEXT NOT NULL,
     session_id TEXT NOT NULL,
-    audio_input TEXT, -- Stored as hex string
+    audio_input_url TEXT, -- Object path in the 'audio' storage bucket
     text_input TEXT NOT NULL,
     text_response TEXT NOT NULL,
-    audio_response TEXT, -- Stored as hex string
+    audio_response_url TEXT, -- Object path in the 'audio' storage bucket
     timestamp TIMESTAMPTZ DEFAULT NOW(),
     sample_rate INTEGER DEFAULT 16000,
     audio_format TEXT DEFAULT 'wav'
 );
 
+-- Existing installs: add the storage path columns, then run migrate_audio_to_storage.py
+-- and drop the legacy hex columns once it reports every row as migrated
+ALTER TABLE conversation_records ADD COLUMN IF NOT EXISTS audio_input_url TEXT;
+ALTER TABLE conversation_records ADD COLUMN IF NOT EXISTS audio_response_url TEXT;
+-- ALTER TABLE conversation_records DROP COLUMN IF EXISTS audio_input, DROP COLUMN IF EXISTS audio_response;
+
+-- Create private storage bucket for audio blobs (served through pre-signed URLs)
+INSERT INTO storage.buckets (id, name, public)
+VALUES ('audio', 'audio', FALSE)
+ON CONFLICT (id) DO NOTHING;
+
 -- Create user_sessions table
 CREATE TABLE IF NOT EXISTS user_sessions (
     session_id TEXT PRIMARY KEY,
@@ -25,11 +36,23 @@ CREATE TABLE IF NOT EXISTS user_sessions (
 );
 
 -- Create indexes for better performance
-CREATE INDEX IF NOT EXISTS idx_conversation_records_user_id ON conversation_records(user_id);
-CREATE INDEX IF NOT EXISTS idx_conversation_records_session_id ON conversation_records(session_id);
+-- Composite (owner, timestamp DESC, id DESC) indexes serve keyset history pages as a single range scan
+-- INCLUDE carries the small projected columns; text_input/text_response stay out because
+-- long utterances would exceed the B-tree index row size limit
+DROP INDEX IF EXISTS ix_conv_user_time;
+DROP INDEX IF EXISTS ix_conv_user_session_time;
+CREATE INDEX IF NOT EXISTS ix_conv_user_time ON conversation_records(user_id, timestamp DESC, id DESC)
+    INCLUDE (session_id, sample_rate, audio_format);
+CREATE INDEX IF NOT EXISTS ix_conv_user_session_time ON conversation_records(user_id, session_id, timestamp DESC, id DESC)
+    INCLUDE (sample_rate, audio_format);
+DROP INDEX IF EXISTS ix_conv_session_time;
+DROP INDEX IF EXISTS idx_conversation_records_user_id;
+DROP INDEX IF EXISTS idx_conversation_records_session_id;
 CREATE INDEX IF NOT EXISTS idx_conversation_records_timestamp ON conversation_records(timestamp DESC);
-CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions(user_id);
-CREATE INDEX IF NOT EXISTS idx_user_sessions_active ON user_sessions(is_active) WHERE is_active = TRUE;
+-- Active sessions by owner; the partial predicate keeps inactive sessions out of the index
+DROP INDEX IF EXISTS idx_user_sessions_user_id;
+DROP INDEX IF EXISTS idx_user_sessions_active;
+CREATE INDEX IF NOT EXISTS ix_sessions_user_active ON user_sessions(user_id) WHERE is_active = TRUE;
 
 -- Enable Row Level Security (RLS) for security
 ALTER TABLE conversation_records ENABLE ROW LEVEL SECURITY;
@@ -90,6 +113,13 @@ CREATE TRIGGER update_session_activity_trigger
     FOR EACH ROW
     EXECUTE FUNCTION update_session_activity();
 
+-- Report which of the given tables exist, so setup checks need one round trip
+CREATE OR REPLACE FUNCTION tables_exist(names TEXT[])
+RETURNS SETOF TEXT AS $$
+    SELECT tablename::text FROM pg_catalog.pg_tables
+    WHERE schemaname = 'public' AND tablename = ANY(names);
+$$ LANGUAGE sql STABLE;
+
 -- Create a function to clean up old inactive sessions (optional)
 CREATE OR REPLACE FUNCTION cleanup_inactive_sessions()
 RETURNS void AS $$
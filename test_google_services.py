@@ -4,11 +4,18 @@ Google Cloud Services Test Script
 Tests Speech-to-Text and Text-to-Speech functionality
 """
 
+import contextlib
+import importlib.util
+import io
+import itertools
 import os
 import sys
 import json
 import logging
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 
 # Configure logging
 logging.basicConfig(
@@ -17,6 +24,24 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# orjson parses and pretty-prints in C; its JSONDecodeError subclasses json's
+try:
+    import orjson
+    json_loads = orjson.loads
+    
+    def dump_json(data) -> str:
+        """Indented JSON for the test report"""
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+except ImportError:
+    json_loads = json.loads
+    
+    def dump_json(data) -> str:
+        """Indented JSON for the test report"""
+        return json.dumps(data, indent=2)
+
+# Fields every service account key file must have
+REQUIRED_CREDENTIAL_FIELDS = frozenset(('type', 'project_id', 'private_key', 'client_email'))
+
 def print_header(title):
     """Print a formatted header"""
     print("\n" + "="*60)
@@ -49,14 +74,13 @@ def check_environment():
     
     # Validate JSON format
     try:
-        with open(creds_path, 'r') as f:
-            creds_data = json.load(f)
+        with open(creds_path, 'rb') as f:
+            creds_data = json_loads(f.read())
         
-        required_fields = ['type', 'project_id', 'private_key', 'client_email']
-        missing_fields = [field for field in required_fields if field not in creds_data]
+        missing_fields = REQUIRED_CREDENTIAL_FIELDS - creds_data.keys()
         
         if missing_fields:
-            print(f"❌ Invalid credentials file - missing fields: {missing_fields}")
+            print(f"❌ Invalid credentials file - missing fields: {sorted(missing_fields)}")
             return False
         
         print(f"✅ Credentials file is valid JSON")
@@ -76,22 +100,139 @@ def test_imports():
     """Test if required packages are installed"""
     print_header("Package Import Test")
     
-    try:
-        import google.cloud.speech
-        print("✅ google-cloud-speech imported successfully")
-    except ImportError as e:
-        print(f"❌ google-cloud-speech import failed: {e}")
-        print("   Install with: pip install google-cloud-speech")
+    # find_spec locates each package without executing it, so this check does not pay
+    # for loading the gRPC and protobuf descriptors; the service tests import them
+    for module, package in (("google.cloud.speech", "google-cloud-speech"),
+                            ("google.cloud.texttospeech", "google-cloud-texttospeech")):
+        try:
+            found = importlib.util.find_spec(module) is not None
+        except ImportError:  # the google.cloud namespace itself is missing
+            found = False
+        if not found:
+            print(f"❌ {package} not found")
+            print(f"   Install with: pip install {package}")
+            return False
+        print(f"✅ {package} is installed")
+    
+    return True
+
+@contextlib.contextmanager
+def stub_speech_client(results):
+    """
+    Yield (services, speech): a configured GoogleCloudServices whose SpeechClient is a
+    mock autospecced on the real streaming_recognize helper, with a fake
+    google.cloud.speech module patched in. results lists (transcript, is_final) pairs;
+    like the live API, one streaming response is sent per audio request received,
+    and any left over once the audio ends follow it
+    """
+    from unittest import mock
+    from google_services import GoogleCloudServices
+    
+    def streaming_recognize(config, requests, *, retry=None, timeout=None, metadata=()):
+        """Signature of google.cloud.speech.SpeechClient.streaming_recognize"""
+    
+    def recognize(config, requests, **kwargs):
+        responses = iter([mock.MagicMock(results=[mock.MagicMock(
+            is_final=is_final, alternatives=[mock.MagicMock(transcript=transcript, confidence=0.9)]
+        )]) for transcript, is_final in results])
+        for _ in requests:
+            yield from itertools.islice(responses, 1)
+        yield from responses
+    
+    speech = mock.MagicMock()
+    cloud = mock.MagicMock(speech=speech)
+    services = GoogleCloudServices.__new__(GoogleCloudServices)
+    services.is_configured = True
+    services.speech_config = mock.MagicMock(language_code="en-US")
+    services.speech_client = mock.MagicMock()
+    services.speech_client.streaming_recognize = mock.create_autospec(streaming_recognize, side_effect=recognize)
+    modules = {"google": mock.MagicMock(cloud=cloud), "google.cloud": cloud, "google.cloud.speech": speech}
+    with mock.patch.dict(sys.modules, modules):
+        yield services, speech
+
+def test_streaming_call_shape():
+    """Check streaming recognition calls SpeechClient.streaming_recognize(config=..., requests=...)"""
+    print_header("Streaming Recognition Call Test")
+    from unittest import mock
+    
+    chunk = bytes(320)
+    with stub_speech_client([("hello world", True)]) as (services, speech):
+        transcript, metadata = services.transcribe_stream([chunk, chunk])
+    
+    if transcript != "hello world":
+        print(f"❌ Streaming transcription failed: {dump_json(metadata)}")
+        return False
+    
+    call = services.speech_client.streaming_recognize.call_args
+    if call.kwargs.get("config") is not speech.StreamingRecognitionConfig.return_value:
+        print(f"❌ streaming_recognize was not given the streaming config: {call}")
+        return False
+    # The helper sends the config request itself; every request we build carries audio
+    if speech.StreamingRecognizeRequest.call_args_list != [mock.call(audio_content=chunk)] * 2:
+        print(f"❌ Unexpected audio requests: {speech.StreamingRecognizeRequest.call_args_list}")
+        return False
+    if metadata["audio_size_bytes"] != 2 * len(chunk):
+        print(f"❌ Audio size not counted: {dump_json(metadata)}")
+        return False
+    
+    print("✅ streaming_recognize called with config= and a lazy requests= iterator")
+    return True
+
+def test_transcribe_stream_interim():
+    """Check the chunked transcription Streamlit uses reports partials and joins finals"""
+    print_header("Chunked Transcription Test")
+    
+    interim = []
+    results = [("hello", False), ("hello world", True), ("how", False), ("how are you", True)]
+    with stub_speech_client(results) as (services, _):
+        chunks = (bytes(320) for _ in range(4))
+        transcript, metadata = services.transcribe_stream(chunks, on_interim=interim.append)
+    
+    if transcript != "hello world how are you" or metadata.get("segments") != 2:
+        print(f"❌ Unexpected transcript {transcript!r}: {dump_json(metadata)}")
+        return False
+    if interim != ["hello", "hello world how"]:
+        print(f"❌ Unexpected interim transcripts: {interim}")
         return False
     
+    print("✅ Partials reported and final segments joined")
+    return True
+
+def test_websocket_audio_stream():
+    """Stream an audio envelope through /ws/audio against a stubbed SpeechClient"""
+    print_header("WebSocket Audio Stream Test")
+    from unittest import mock
+    
     try:
-        import google.cloud.texttospeech
-        print("✅ google-cloud-texttospeech imported successfully")
+        import msgpack
+        from fastapi.testclient import TestClient
+        import main
     except ImportError as e:
-        print(f"❌ google-cloud-texttospeech import failed: {e}")
-        print("   Install with: pip install google-cloud-texttospeech")
+        print(f"⚠️ {e} - skipping WebSocket test")
+        return True
+    
+    with stub_speech_client([("hello there", True)]) as (services, _), \
+            mock.patch.object(services, "text_to_speech", return_value=(b"RIFF", {})), \
+            mock.patch.multiple(main, google_services=services, GOOGLE_SERVICES_AVAILABLE=True,
+                                LLM_AVAILABLE=False, DATABASE_AVAILABLE=False):
+        # Without a with-block the client skips startup, so no real backends are touched
+        with TestClient(main.app).websocket_connect("/ws/audio") as websocket:
+            websocket.send_bytes(msgpack.packb({"t": "audio", "d": bytes(3200)}))
+            frames = [msgpack.unpackb(websocket.receive_bytes(), raw=False)]
+            # A recognition failure arrives as a single error envelope
+            if frames[0]["t"] != "error":
+                frames += [msgpack.unpackb(websocket.receive_bytes(), raw=False) for _ in range(2)]
+    
+    print(f"📨 Frames: {[(frame['t'], frame.get('final')) for frame in frames]}")
+    if [frame["t"] for frame in frames] != ["transcript", "text", "audio"]:
+        print(f"   First frame: {frames[0]}")
+        print("❌ Expected transcript, text and audio envelopes")
+        return False
+    if frames[0]["d"] != "hello there" or not frames[0]["final"]:
+        print(f"❌ Unexpected transcript envelope: {frames[0]}")
         return False
     
+    print("✅ WebSocket audio transcribed and answered")
     return True
 
 def test_google_services():
@@ -108,7 +249,7 @@ def test_google_services():
         # Get service status
         print_section("Service Status")
         status = google_services.get_service_status()
-        print(json.dumps(status, indent=2))
+        print(dump_json(status))
         
         if not status["configured"]:
             print("❌ Google Cloud Services not properly configured")
@@ -117,7 +258,7 @@ def test_google_services():
         # Test services
         print_section("Service Tests")
         test_results = google_services.test_services()
-        print(json.dumps(test_results, indent=2))
+        print(dump_json(test_results))
         
         # Check overall status
         if test_results["overall_status"] == "all_working":
@@ -140,13 +281,10 @@ def test_speech_to_text():
     
     try:
         from google_services import google_services
-        import numpy as np
         
-        # Create a simple test audio (silence)
+        # Create a simple test audio: 1s of 16-bit silence
         sample_rate = 16000
-        duration = 1.0
-        audio_data = np.zeros(int(sample_rate * duration), dtype=np.int16)
-        audio_bytes = audio_data.tobytes()
+        audio_bytes = bytes(2 * sample_rate)
         
         print(f"📊 Test audio created: {len(audio_bytes)} bytes")
         
@@ -154,7 +292,7 @@ def test_speech_to_text():
         transcript, metadata = google_services.speech_to_text(audio_bytes)
         
         print(f"📝 Transcription result: {transcript}")
-        print(f"📊 Metadata: {json.dumps(metadata, indent=2)}")
+        print(f"📊 Metadata: {dump_json(metadata)}")
         
         if "error" in metadata:
             print(f"❌ Speech-to-Text failed: {metadata['error']}")
@@ -182,13 +320,19 @@ def test_text_to_speech():
         
         if audio_response:
             print(f"🔊 Audio generated: {len(audio_response)} bytes")
-            print(f"📊 Metadata: {json.dumps(metadata, indent=2)}")
+            print(f"📊 Metadata: {dump_json(metadata)}")
             
-            # Save test audio file
-            test_filename = f"test_audio_{datetime.now().strftime('%Y%m%d_%H%M%S')}.wav"
-            with open(test_filename, 'wb') as f:
-                f.write(audio_response)
-            print(f"💾 Test audio saved as: {test_filename}")
+            # LINEAR16 synthesis comes back as a WAV file
+            if audio_response[:4] != b"RIFF":
+                print("❌ Text-to-Speech returned audio without a WAV header")
+                return False
+            
+            # Save test audio file only when asked, e.g. to listen to it
+            if os.getenv("SAVE_TTS_AUDIO"):
+                test_filename = f"test_audio_{time.strftime('%Y%m%d_%H%M%S')}.wav"
+                with open(test_filename, 'wb') as f:
+                    f.write(audio_response)
+                print(f"💾 Test audio saved as: {test_filename}")
             
             print("✅ Text-to-Speech test completed")
             return True
@@ -208,16 +352,24 @@ def test_api_endpoints():
         import requests
         
         base_url = "http://localhost:8000"
+        # Pooled keep-alive connections for the probes
+        session = requests.Session()
+        
+        # The three probes are independent: send them together, report them in order
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            health_probe = executor.submit(session.get, f"{base_url}/health", timeout=5)
+            status_probe = executor.submit(session.get, f"{base_url}/services/status", timeout=5)
+            services_test_probe = executor.submit(session.get, f"{base_url}/services/test", timeout=10)
         
         # Test health endpoint
         print_section("Health Check")
         try:
-            response = requests.get(f"{base_url}/health", timeout=5)
+            response = health_probe.result()
             if response.status_code == 200:
                 health_data = response.json()
                 print("✅ Health endpoint working")
                 print(f"📊 Status: {health_data.get('status', 'unknown')}")
-                print(f"📊 Services: {json.dumps(health_data.get('services', {}), indent=2)}")
+                print(f"📊 Services: {dump_json(health_data.get('services', {}))}")
             else:
                 print(f"❌ Health endpoint returned status {response.status_code}")
         except requests.exceptions.RequestException as e:
@@ -227,11 +379,11 @@ def test_api_endpoints():
         # Test services status endpoint
         print_section("Services Status")
         try:
-            response = requests.get(f"{base_url}/services/status", timeout=5)
+            response = status_probe.result()
             if response.status_code == 200:
                 status_data = response.json()
                 print("✅ Services status endpoint working")
-                print(f"📊 Status: {json.dumps(status_data, indent=2)}")
+                print(f"📊 Status: {dump_json(status_data)}")
             else:
                 print(f"❌ Services status endpoint returned status {response.status_code}")
         except requests.exceptions.RequestException as e:
@@ -240,16 +392,17 @@ def test_api_endpoints():
         # Test services test endpoint
         print_section("Services Test")
         try:
-            response = requests.get(f"{base_url}/services/test", timeout=10)
+            response = services_test_probe.result()
             if response.status_code == 200:
                 test_data = response.json()
                 print("✅ Services test endpoint working")
-                print(f"📊 Test results: {json.dumps(test_data, indent=2)}")
+                print(f"📊 Test results: {dump_json(test_data)}")
             else:
                 print(f"❌ Services test endpoint returned status {response.status_code}")
         except requests.exceptions.RequestException as e:
             print(f"❌ Services test endpoint not accessible: {e}")
         
+        session.close()
         return True
         
     except ImportError:
@@ -260,35 +413,81 @@ def test_api_endpoints():
         print(f"❌ API endpoint tests failed: {e}")
         return False
 
+class ThreadBufferedStdout:
+    """
+    Stand-in for sys.stdout that sends each capturing thread's prints to its own
+    buffer, so concurrently running tests don't interleave their reports
+    """
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+    
+    def write(self, text):
+        return getattr(self.local, "buffer", self.stream).write(text)
+    
+    def flush(self):
+        self.stream.flush()
+    
+    def capture(self, func, *args):
+        """Run func in this thread, returning (printed output, result)"""
+        self.local.buffer = io.StringIO()
+        try:
+            result = func(*args)
+            return self.local.buffer.getvalue(), result
+        finally:
+            del self.local.buffer
+
+def run_test(test_name, test_func):
+    """Run one test, treating an exception as a failure"""
+    print_section(f"Running: {test_name}")
+    try:
+        return test_func()
+    except Exception as e:
+        print(f"❌ {test_name} failed with exception: {e}")
+        return False
+
 def main():
     """Run all tests"""
     print_header("Google Cloud Services Test Suite")
-    print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"Started at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
     
-    tests = [
+    # Local checks first, then the network-bound tests concurrently
+    local_tests = [
         ("Environment Check", check_environment),
         ("Package Imports", test_imports),
+        ("Streaming Recognition Call", test_streaming_call_shape),
+        ("Chunked Transcription", test_transcribe_stream_interim),
+        ("WebSocket Audio Stream", test_websocket_audio_stream),
+    ]
+    network_tests = [
         ("Google Services", test_google_services),
         ("Speech-to-Text", test_speech_to_text),
         ("Text-to-Speech", test_text_to_speech),
         ("API Endpoints", test_api_endpoints),
     ]
     
-    results = []
+    results = [(test_name, run_test(test_name, test_func)) for test_name, test_func in local_tests]
     
-    for test_name, test_func in tests:
-        print_section(f"Running: {test_name}")
-        try:
-            result = test_func()
-            results.append((test_name, result))
-        except Exception as e:
-            print(f"❌ {test_name} failed with exception: {e}")
-            results.append((test_name, False))
+    # Each worker prints into its own buffer; reports are written in the listed order
+    stdout = sys.stdout
+    sys.stdout = ThreadBufferedStdout(stdout)
+    try:
+        with ThreadPoolExecutor(max_workers=len(network_tests)) as executor:
+            futures = [(test_name, executor.submit(sys.stdout.capture, run_test, test_name, test_func))
+                       for test_name, test_func in network_tests]
+            for test_name, future in futures:
+                output, result = future.result()
+                stdout.write(output)
+                results.append((test_name, result))
+    finally:
+        sys.stdout = stdout
     
     # Summary
     print_header("Test Summary")
     
-    passed = sum(1 for _, result in results if result)
+    # Results are booleans, so summing them counts the passes
+    passed = sum(map(itemgetter(1), results))
     total = len(results)
     
     print(f"Tests passed: {passed}/{total}")
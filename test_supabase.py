@@ -4,14 +4,30 @@ Test script for Supabase integration
 Run this to verify that the Supabase connection and operations work correctly
 """
 
+import contextlib
+import io
 import uuid
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import sys
 import os
+from env_config import load_env
+
+load_env()
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+# One session and user for the whole run; uuid4 keeps concurrent runs from colliding
+TEST_SESSION_ID = str(uuid.uuid4())
+TEST_USER_ID = f"test_user_{TEST_SESSION_ID[:8]}"
+
+# Audio payloads for the test record; stored as raw bytes, no encoding step
+TEST_AUDIO_INPUT = b"test audio data"
+TEST_AUDIO_RESPONSE = b"test response audio data"
+
+# Set TEST_VERBOSE=1 to print the ids and values behind each check
+VERBOSE = bool(os.getenv("TEST_VERBOSE"))
+
 def test_audio_conversion_bug():
     """Test the audio conversion bug fix"""
     print("🧪 Testing audio conversion bug fix...")
@@ -19,9 +35,6 @@ def test_audio_conversion_bug():
     try:
         from models import conversation_service
         
-        # Create a mock record with missing audio_response
-        test_record_id = str(uuid.uuid4())
-        
         # Test the get_conversation_record method with various scenarios
         print("✅ Testing audio conversion with None values...")
         
@@ -52,14 +65,23 @@ def test_supabase_connection():
             print("❌ Supabase connection failed")
             return False
         
+        # Check every required table with one tables_exist() RPC round trip
+        print("\n🗄️ Checking schema...")
+        from setup_supabase_schema import REQUIRED_TABLES, batch_tables_exist
+        missing = set(REQUIRED_TABLES) - batch_tables_exist(supabase_client.client, REQUIRED_TABLES)
+        if missing:
+            print(f"❌ Missing tables: {', '.join(sorted(missing))}. Run supabase_schema.sql first")
+            return False
+        print("✅ All required tables exist")
+        
         # Test session creation
         print("\n👤 Testing session creation...")
-        test_session_id = str(uuid.uuid4())
-        test_user_id = "test_user_" + str(uuid.uuid4())[:8]
+        test_session_id = TEST_SESSION_ID
+        test_user_id = TEST_USER_ID
         
         session_result = session_service.create_user_session(test_session_id, test_user_id)
         if session_result:
-            print(f"✅ Session created: {session_result['session_id']}")
+            print(f"✅ Session created: {session_result['session_id']}" if VERBOSE else "✅ Session created")
         else:
             print("❌ Failed to create session")
             return False
@@ -69,31 +91,39 @@ def test_supabase_connection():
         test_record = conversation_service.create_conversation_record(
             user_id=test_user_id,
             session_id=test_session_id,
-            audio_input=b"test audio data",
+            audio_input=TEST_AUDIO_INPUT,
             text_input="Hello, this is a test message",
             text_response="This is a test response from the assistant",
-            audio_response=b"test response audio data"
+            audio_response=TEST_AUDIO_RESPONSE
         )
         
         if test_record:
-            print(f"✅ Conversation record created: {test_record['id']}")
+            print(f"✅ Conversation record created: {test_record['id']}" if VERBOSE else "✅ Conversation record created")
             record_id = test_record['id']
         else:
             print("❌ Failed to create conversation record")
             return False
         
+        # The remaining checks only depend on the rows created above, so their
+        # round trips run concurrently; results are reported in order
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            retrieved_record = executor.submit(conversation_service.get_conversation_record, record_id)
+            history = executor.submit(conversation_service.get_conversation_history, test_user_id, limit=10)
+            retrieved_session = executor.submit(session_service.get_user_session, test_session_id)
+            updated_session = executor.submit(session_service.update_session_activity, test_session_id)
+        
         # Test retrieving conversation record
         print("\n📖 Testing conversation record retrieval...")
-        retrieved_record = conversation_service.get_conversation_record(record_id)
+        retrieved_record = retrieved_record.result()
         if retrieved_record:
-            print(f"✅ Retrieved record: {retrieved_record['text_input']}")
+            print(f"✅ Retrieved record: {retrieved_record['text_input']}" if VERBOSE else "✅ Retrieved record")
         else:
             print("❌ Failed to retrieve conversation record")
             return False
         
         # Test conversation history
         print("\n📚 Testing conversation history...")
-        history = conversation_service.get_conversation_history(test_user_id, limit=10)
+        history = history.result()
         if history:
             print(f"✅ Retrieved {len(history)} conversation(s) from history")
         else:
@@ -101,18 +131,18 @@ def test_supabase_connection():
         
         # Test session retrieval
         print("\n🔍 Testing session retrieval...")
-        retrieved_session = session_service.get_user_session(test_session_id)
+        retrieved_session = retrieved_session.result()
         if retrieved_session:
-            print(f"✅ Retrieved session: {retrieved_session['user_id']}")
+            print(f"✅ Retrieved session: {retrieved_session['user_id']}" if VERBOSE else "✅ Retrieved session")
         else:
             print("❌ Failed to retrieve session")
             return False
         
         # Test session activity update
         print("\n⏰ Testing session activity update...")
-        updated_session = session_service.update_session_activity(test_session_id)
+        updated_session = updated_session.result()
         if updated_session:
-            print(f"✅ Updated session activity: {updated_session['last_activity']}")
+            print(f"✅ Updated session activity: {updated_session['last_activity']}" if VERBOSE else "✅ Updated session activity")
         else:
             print("❌ Failed to update session activity")
             return False
@@ -121,11 +151,22 @@ def test_supabase_connection():
         print("\n🔧 Testing audio conversion bug fix...")
         test_audio_conversion_bug()
         
+        # Clean up: the record delete and session deactivation are independent
+        print("\n🧹 Cleaning up test data...")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            deleted = executor.submit(supabase_client.delete_conversation_record, record_id)
+            deactivated = executor.submit(supabase_client.deactivate_session, test_session_id)
+        if deleted.result() and deactivated.result():
+            print("✅ Test record deleted and session deactivated")
+        else:
+            print("⚠️ Cleanup incomplete; remove the test rows manually")
+        
         print("\n🎉 All tests passed! Supabase integration is working correctly.")
-        print(f"\n📊 Test Summary:")
-        print(f"   - User ID: {test_user_id}")
-        print(f"   - Session ID: {test_session_id}")
-        print(f"   - Record ID: {record_id}")
+        if VERBOSE:
+            print(f"\n📊 Test Summary:")
+            print(f"   - User ID: {test_user_id}")
+            print(f"   - Session ID: {test_session_id}")
+            print(f"   - Record ID: {record_id}")
         
         return True
 
@@ -141,39 +182,55 @@ def test_environment():
     """Test environment configuration"""
     print("\n🔧 Testing environment configuration...")
     
-    from dotenv import load_dotenv
-    load_dotenv()
-    
     supabase_url = os.getenv('SUPABASE_URL')
     supabase_key = os.getenv('SUPABASE_KEY')
     
     if supabase_url:
-        print(f"✅ SUPABASE_URL is set: {supabase_url}")
+        print(f"✅ SUPABASE_URL is set: {supabase_url}" if VERBOSE else "✅ SUPABASE_URL is set")
     else:
         print("❌ SUPABASE_URL is not set in environment")
         return False
     
     if supabase_key:
-        print(f"✅ SUPABASE_KEY is set: {supabase_key[:20]}...")
+        print(f"✅ SUPABASE_KEY is set: {supabase_key[:20]}..." if VERBOSE else "✅ SUPABASE_KEY is set")
     else:
         print("❌ SUPABASE_KEY is not set in environment")
         return False
     
     return True
 
-if __name__ == "__main__":
-    print("🚀 Voice Assistant Supabase Integration Test")
-    print("=" * 50)
-    
+@contextlib.contextmanager
+def buffered_output():
+    """Collect a test's status lines and write them to stdout in one go"""
+    buffer = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(buffer):
+            yield
+    finally:
+        sys.stdout.write(buffer.getvalue())
+        sys.stdout.flush()
+
+def run_all() -> bool:
+    """Run the environment and integration tests; True when everything passed"""
     # Test environment first
-    if not test_environment():
+    with buffered_output():
+        environment_ok = test_environment()
+    if not environment_ok:
         print("\n❌ Environment test failed. Please check your .env file.")
-        sys.exit(1)
+        return False
     
     # Test Supabase integration
-    if test_supabase_connection():
+    with buffered_output():
+        connection_ok = test_supabase_connection()
+    if connection_ok:
         print("\n✅ All tests completed successfully!")
-        sys.exit(0)
+        return True
     else:
         print("\n❌ Some tests failed. Please check the error messages above.")
-        sys.exit(1)
+        return False
+
+if __name__ == "__main__":
+    print("🚀 Voice Assistant Supabase Integration Test")
+    print("=" * 50)
+    
+    sys.exit(0 if run_all() else 1)
@@ -1,21 +1,57 @@
 import torch
 import numpy as np
 import io
-import wave
-from typing import List, Tuple
+import struct
+import threading
+from functools import lru_cache
+from typing import Iterable, Iterator, List, Tuple
 import torchaudio
 
+# The ONNX export of Silero runs small windows without TorchScript/autograd overhead;
+# fall back to the JIT model when onnxruntime is not installed
+try:
+    import onnxruntime  # noqa: F401
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# Leading bytes of the containers AudioFormat allows (WAV, FLAC, OGG, MP3 with ID3 tag)
+CONTAINER_MAGIC = (b'RIFF', b'fLaC', b'OggS', b'ID3')
+
+# Speech probability above which a window counts as speech
+DEFAULT_THRESHOLD = 0.5
+
+# Silero scores 512-sample windows at 16 kHz; streamed s16le audio is cut into these
+STREAM_WINDOW_BYTES = 512 * 2
+
+# Clips above this size (about a minute of 16 kHz PCM) are not kept for reuse by the next call
+MAX_CACHED_ANALYSIS_BYTES = 2 * 1024 * 1024
+
+# RIFF/WAVE header for 16-bit mono PCM: riff tag, riff size, fmt chunk, data chunk header
+WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+@lru_cache(maxsize=8)
+def get_resampler(orig_freq: int, new_freq: int) -> torchaudio.transforms.Resample:
+    """Build a resampler once per rate pair; its sinc kernel is costly to precompute"""
+    return torchaudio.transforms.Resample(orig_freq, new_freq)
+
 class SileroVADProcessor:
     def __init__(self, model_name: str = 'silero_vad'):
         self.model, self.utils = torch.hub.load(
             repo_or_dir='snakers4/silero-vad',
             model=model_name,
             force_reload=False,
-            onnx=False
+            onnx=ONNX_AVAILABLE
         )
         
+        # Pure forward inference; the ONNX wrapper has no train/eval modes
+        if hasattr(self.model, 'eval'):
+            self.model.eval()
+        
         self.get_speech_timestamps, self.save_audio, self.read_audio, self.VADIterator, self.collect_chunks = self.utils
         self.sampling_rate = 16000
+        # (audio_bytes, tensor, timestamps) of the last clip analyzed on each thread
+        self._last_analysis = threading.local()
         
     def detect_speech_segments(self, audio_bytes: bytes) -> List[Tuple[float, float]]:
         """
@@ -23,15 +59,8 @@ class SileroVADProcessor:
         Returns list of (start_time, end_time) tuples in seconds
         """
         try:
-            # Convert bytes to tensor
-            audio_tensor = self._bytes_to_tensor(audio_bytes)
-            
-            # Get speech timestamps
-            speech_timestamps = self.get_speech_timestamps(
-                audio_tensor, 
-                self.model, 
-                sampling_rate=self.sampling_rate
-            )
+            # Decode and sweep, or reuse the analysis of the same clip
+            _, speech_timestamps = self._analyze(audio_bytes)
             
             # Convert to seconds
             segments = []
@@ -46,55 +75,131 @@ class SileroVADProcessor:
             print(f"Error in speech detection: {e}")
             return []
     
-    def is_speech_present(self, audio_bytes: bytes, threshold: float = 0.5) -> bool:
+    def detect_speech_segments_stream(self, audio_chunks: Iterable[bytes]) -> Iterator[Tuple[float, float]]:
+        """
+        Detect speech segments in streamed 16 kHz mono s16le audio.
+        Yields each (start_time, end_time) in seconds as soon as its end of speech is
+        detected, instead of waiting for the whole utterance
+        """
+        vad_iterator = self.VADIterator(
+            self.model,
+            sampling_rate=self.sampling_rate,
+            min_silence_duration_ms=200,
+            speech_pad_ms=30
+        )
+        pending = b""
+        start_sec = None
+        try:
+            for chunk in audio_chunks:
+                pending += chunk
+                usable = len(pending) - len(pending) % STREAM_WINDOW_BYTES
+                for offset in range(0, usable, STREAM_WINDOW_BYTES):
+                    window = self._pcm_to_tensor(pending[offset:offset + STREAM_WINDOW_BYTES])
+                    with torch.inference_mode():
+                        event = vad_iterator(window, return_seconds=True)
+                    if not event:
+                        continue
+                    if 'start' in event:
+                        start_sec = event['start']
+                    if 'end' in event and start_sec is not None:
+                        yield start_sec, event['end']
+                        start_sec = None
+                pending = pending[usable:]
+            
+            # Speech still open when the stream ends runs to the last sample seen
+            if start_sec is not None:
+                yield start_sec, vad_iterator.current_sample / self.sampling_rate
+        finally:
+            vad_iterator.reset_states()
+    
+    def is_speech_present(self, audio_bytes: bytes, threshold: float = DEFAULT_THRESHOLD) -> bool:
         """
         Check if speech is present in the audio
         """
         try:
+            # The model scores fixed 512-sample windows, so presence means any window
+            # sequence crossed the threshold
+            if threshold == DEFAULT_THRESHOLD:
+                return bool(self._analyze(audio_bytes)[1])
             audio_tensor = self._bytes_to_tensor(audio_bytes)
-            speech_prob = self.model(audio_tensor, self.sampling_rate).item()
-            return speech_prob > threshold
+            return bool(self._speech_timestamps(audio_tensor, threshold))
         except Exception as e:
             print(f"Error checking speech presence: {e}")
             return False
     
     def extract_speech_segments(self, audio_bytes: bytes) -> List[bytes]:
         """
-        Extract only the speech segments from audio
+        Extract only the speech segments from audio.
+        An empty list means no speech was detected, so callers need no separate
+        is_speech_present pass over the same audio
         """
         try:
-            audio_tensor = self._bytes_to_tensor(audio_bytes)
-            speech_timestamps = self.get_speech_timestamps(
-                audio_tensor, 
-                self.model, 
-                sampling_rate=self.sampling_rate
-            )
+            audio_tensor, speech_timestamps = self._analyze(audio_bytes)
+            # Segmentation is the last step on a clip; don't pin its bytes and tensor
+            self._last_analysis.value = None
             
-            speech_segments = []
-            for timestamp in speech_timestamps:
-                start_sample = timestamp['start']
-                end_sample = timestamp['end']
-                segment = audio_tensor[start_sample:end_sample]
-                segment_bytes = self._tensor_to_bytes(segment)
-                speech_segments.append(segment_bytes)
-                
-            return speech_segments
+            if not speech_timestamps:
+                return []
+            
+            # Convert the whole clip to int16 once; segments are byte slices of it
+            pcm = memoryview(self._tensor_to_pcm(audio_tensor))
+            return [
+                self._wav_bytes(pcm[timestamp['start'] * 2:timestamp['end'] * 2])
+                for timestamp in speech_timestamps
+            ]
             
         except Exception as e:
             print(f"Error extracting speech segments: {e}")
             return [audio_bytes]  # Return original if extraction fails
     
+    def warmup(self):
+        """Run one silent sweep so the first request skips the model's lazy kernel setup"""
+        self._speech_timestamps(torch.zeros(self.sampling_rate))
+        # 48 kHz is the usual rate for browser and phone WAV uploads
+        get_resampler(48000, self.sampling_rate)
+    
+    def _analyze(self, audio_bytes: bytes) -> Tuple[torch.Tensor, List[dict]]:
+        """
+        Decode a clip and find its speech timestamps at the default threshold.
+        The result for the last clip is kept per thread until it is segmented, so a
+        presence check followed by segmentation decodes and sweeps it only once
+        """
+        last = getattr(self._last_analysis, 'value', None)
+        if last is not None and last[0] == audio_bytes:
+            return last[1], last[2]
+        
+        audio_tensor = self._bytes_to_tensor(audio_bytes)
+        speech_timestamps = self._speech_timestamps(audio_tensor)
+        if len(audio_bytes) <= MAX_CACHED_ANALYSIS_BYTES:
+            self._last_analysis.value = (audio_bytes, audio_tensor, speech_timestamps)
+        else:
+            self._last_analysis.value = None
+        return audio_tensor, speech_timestamps
+    
+    def _speech_timestamps(self, audio_tensor: torch.Tensor, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+        """Run the windowed VAD sweep without autograd bookkeeping on every window"""
+        with torch.inference_mode():
+            return self.get_speech_timestamps(
+                audio_tensor,
+                self.model,
+                threshold=threshold,
+                sampling_rate=self.sampling_rate
+            )
+    
     def _bytes_to_tensor(self, audio_bytes: bytes) -> torch.Tensor:
         """Convert audio bytes to tensor"""
+        # The gRPC and WebSocket pipelines mostly send headerless 16 kHz mono s16le,
+        # so only real containers go through the torchaudio decoder
+        if not self._is_container(audio_bytes):
+            return self._pcm_to_tensor(audio_bytes)
+        
         try:
-            # Try to load as WAV first
             audio_io = io.BytesIO(audio_bytes)
             waveform, sample_rate = torchaudio.load(audio_io)
             
             # Resample if necessary
             if sample_rate != self.sampling_rate:
-                resampler = torchaudio.transforms.Resample(sample_rate, self.sampling_rate)
-                waveform = resampler(waveform)
+                waveform = get_resampler(sample_rate, self.sampling_rate)(waveform)
             
             # Convert to mono if stereo
             if waveform.shape[0] > 1:
@@ -105,30 +210,42 @@ class SileroVADProcessor:
         except Exception as e:
             # Fallback: assume raw PCM data
             print(f"Failed to load as audio file, treating as raw PCM: {e}")
-            audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
-            audio_tensor = torch.from_numpy(audio_array).float() / 32768.0
-            return audio_tensor
+            return self._pcm_to_tensor(audio_bytes)
+    
+    @staticmethod
+    def _is_container(audio_bytes: bytes) -> bool:
+        """Sniff WAV/FLAC/OGG/MP3 headers; bare MP3 frames start with an 11-bit sync word"""
+        if audio_bytes.startswith(CONTAINER_MAGIC):
+            return True
+        return len(audio_bytes) > 1 and audio_bytes[0] == 0xFF and audio_bytes[1] & 0xE0 == 0xE0
+    
+    def _pcm_to_tensor(self, audio_bytes: bytes) -> torch.Tensor:
+        """View raw s16le PCM without copying, then cast and scale it in one pass"""
+        # A trailing odd byte is not a whole sample
+        audio_array = np.frombuffer(audio_bytes, dtype='<i2', count=len(audio_bytes) // 2)
+        return torch.from_numpy(np.multiply(audio_array, np.float32(1.0 / 32768.0), dtype=np.float32))
     
     def _tensor_to_bytes(self, tensor: torch.Tensor) -> bytes:
-        """Convert tensor back to bytes"""
+        """Convert tensor back to 16-bit mono WAV bytes"""
         try:
-            # Convert to numpy and scale to int16
-            audio_array = (tensor.numpy() * 32767).astype(np.int16)
-            
-            # Create WAV file in memory
-            output_io = io.BytesIO()
-            with wave.open(output_io, 'wb') as wav_file:
-                wav_file.setnchannels(1)  # mono
-                wav_file.setsampwidth(2)  # 16-bit
-                wav_file.setframerate(self.sampling_rate)
-                wav_file.writeframes(audio_array.tobytes())
-            
-            output_io.seek(0)
-            return output_io.read()
-            
+            return self._wav_bytes(self._tensor_to_pcm(tensor))
         except Exception as e:
             print(f"Error converting tensor to bytes: {e}")
             return b""
+    
+    @staticmethod
+    def _tensor_to_pcm(tensor: torch.Tensor) -> bytes:
+        """Scale a float waveform to little-endian int16 PCM"""
+        return (tensor.clamp(-1.0, 1.0) * 32767).numpy().astype('<i2').tobytes()
+    
+    def _wav_bytes(self, pcm) -> bytes:
+        """Prefix 16-bit mono PCM with a WAV header"""
+        header = WAV_HEADER.pack(
+            b'RIFF', WAV_HEADER.size - 8 + len(pcm), b'WAVE',
+            b'fmt ', 16, 1, 1, self.sampling_rate, self.sampling_rate * 2, 2, 16,
+            b'data', len(pcm)
+        )
+        return header + pcm
 
 # Singleton instance
 vad_processor = SileroVADProcessor()